@@ -10,4 +10,54 @@ APP_CONFIG: dict = {
     'llm_temperature': 0.5,
     'pinecone_key': os.getenv('PINECONE_API_KEY'),
     'openai_key': os.getenv('OPENAI_API_KEY'),
+    'index_name': os.getenv('INDEX_NAME', 'project-j-index'),
+    'vector_backend': os.getenv('VECTOR_BACKEND', 'pinecone'),  # or 'local'
+    'local_index_dir': os.getenv('LOCAL_INDEX_DIR', 'vector_index'),
+    'manifest_dir': os.getenv('MANIFEST_DIR', 'vector_index'),  # BM25 index with Pinecone (its manifest lives in the index)
+    'local_ann_min_vectors': int(os.getenv('LOCAL_ANN_MIN_VECTORS', 0)),  # 0 keeps search exact
+    'upload_chunk_bytes': 1024 * 1024,
+    'ingest_batch_pages': int(os.getenv('INGEST_BATCH_PAGES', 8)),
+    'pdf_workers': int(os.getenv('PDF_WORKERS', 1)),
+    'pdf_chunk_tokens': int(os.getenv('PDF_CHUNK_TOKENS', 0)),  # 0 keeps whole paragraphs
+    'pdf_strict_tables': os.getenv('PDF_STRICT_TABLES', '0') == '1',  # scan every page for tables
+    'ingest_batch_tokens': int(os.getenv('INGEST_BATCH_TOKENS', 8000)),  # upper bound; shrinks on rate limits
+    'ingest_batch_size': 128,
+    'ingest_in_flight': int(os.getenv('INGEST_IN_FLIGHT', 4)),
+    'ingest_max_retries': 6,
+    'retriever_mode': os.getenv('RETRIEVER_MODE', 'index_scores'),  # 'embeddings_filter', 'hybrid' or 'bm25'
+    'rrf_k': 60,
+    'lexical_shortcut_confidence': float(os.getenv('LEXICAL_SHORTCUT_CONFIDENCE', 0)),  # 0 always runs the dense query
+    'retriever_k': 20,
+    'similarity_threshold': 0.2,
+    'context_max_tokens': int(os.getenv('CONTEXT_MAX_TOKENS', 3000)),  # 0 stuffs every retrieved chunk
+    'speculative_retrieval': os.getenv('SPECULATIVE_RETRIEVAL', '1') == '1',
+    'speculation_match': os.getenv('SPECULATION_MATCH', 'string'),  # or 'embedding'
+    'speculation_threshold': float(os.getenv('SPECULATION_THRESHOLD', 0.9)),
+    'llm_max_concurrency': int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+    'llm_max_queue': int(os.getenv('LLM_MAX_QUEUE', 64)),
+    'llm_queue_timeout': float(os.getenv('LLM_QUEUE_TIMEOUT', 30)),
+    'embed_batching_enabled': os.getenv('EMBED_BATCHING_ENABLED', '1') == '1',
+    'embed_batch_window_ms': float(os.getenv('EMBED_BATCH_WINDOW_MS', 5)),
+    'embed_batch_max': int(os.getenv('EMBED_BATCH_MAX', 64)),
+    'embed_cache_size': int(os.getenv('EMBED_CACHE_SIZE', 1024)),
+    'answer_cache_enabled': os.getenv('ANSWER_CACHE_ENABLED', '1') == '1',
+    'answer_cache_threshold': float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.95)),
+    'answer_cache_size': 512,
+    'answer_cache_ttl': 3600,
+    'session_backend': os.getenv('SESSION_BACKEND', 'memory'),  # or 'sqlite' to share across workers
+    'session_db_path': os.getenv('SESSION_DB_PATH', 'sessions.db'),
+    'session_max': int(os.getenv('SESSION_MAX', 1000)),
+    'session_idle_ttl': float(os.getenv('SESSION_IDLE_TTL', 3600)),
+    'session_max_messages': 20,
+    'session_max_tokens': 4000,
+    'stream_coalesce_ms': 30,
+    'stream_coalesce_bytes': 256,
+    'ws_send_queue_size': 64,
+    'ws_slow_consumer_policy': os.getenv('WS_SLOW_CONSUMER_POLICY', 'coalesce'),  # 'coalesce' or 'disconnect'
+    'ws_send_timeout': 10.0,
+    'metrics_enabled': os.getenv('METRICS_ENABLED', '1') == '1',
+    'ws_timing': os.getenv('WS_TIMING', '0') == '1',  # clients can also ask with ?timing=1
+    'http_pool_size': int(os.getenv('HTTP_POOL_SIZE', 20)),
+    'http_pool_keepalive': int(os.getenv('HTTP_POOL_KEEPALIVE', 10)),
+    'http_timeout': float(os.getenv('HTTP_TIMEOUT', 60.0)),
 }
\ No newline at end of file
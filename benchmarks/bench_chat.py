@@ -0,0 +1,269 @@
+"""End-to-end load and latency benchmark for the FastAPI app with local stand-ins.
+
+Serves ``main.app`` from a separate uvicorn process with a fake streaming chat
+model, deterministic embeddings and the local vector backend in place of
+OpenAI and Pinecone. Concurrent WebSocket clients run in this process against
+``/chat/{client_id}``, so they do not share the server's event loop, and the
+reported RSS is the server process's alone. Also times ``PDFProcessor`` on the
+sample paper. Results are written as JSON so runs on different commits can be
+compared.
+
+Usage: python benchmarks/bench_chat.py --clients 50 --turns 3 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def rss_mb(pid="self", field="VmRSS"):
+    """Resident set size (``VmHWM``: its peak) of a process in MiB, from /proc."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == "self":
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingestion(pdf_path):
+    from utils import PDFProcessor
+
+    start = time.perf_counter()
+    documents = PDFProcessor(pdf_path).process()
+    elapsed = time.perf_counter() - start
+    return documents, {"pdf": pdf_path, "seconds": elapsed, "documents": len(documents)}
+
+
+def configure_app(args, index_dir):
+    """Point APP_CONFIG at the local backend and swap the OpenAI clients for fakes before main is imported."""
+    from app_config import APP_CONFIG
+
+    APP_CONFIG.update({
+        'openai_key': 'benchmark',
+        'vector_backend': 'local',
+        'local_index_dir': index_dir,
+        'answer_cache_enabled': args.answer_cache,
+        'llm_max_concurrency': args.max_concurrency,
+        'llm_max_queue': max(args.clients * 2, 64),
+    })
+
+    import registry
+    from fakes import FakeEmbeddings, FakeStreamingChatModel
+
+    registry.create_embeddings = lambda **kwargs: FakeEmbeddings(dimension=args.dimension,
+                                                                 latency_ms=args.embedding_ms)
+    registry.create_llm = lambda **kwargs: FakeStreamingChatModel(tokens_per_second=args.token_rate,
+                                                                  answer_tokens=args.answer_tokens,
+                                                                  first_token_ms=args.first_token_ms,
+                                                                  rewrite_ms=args.rewrite_ms)
+    return FakeEmbeddings(dimension=args.dimension)
+
+
+async def run_client(port, client_index, turns, protocol):
+    import websockets
+
+    results = []
+    url = f"ws://127.0.0.1:{port}/chat/bench{client_index}?protocol={protocol}"
+    async with websockets.connect(url, max_size=None) as ws:
+        # Greeting
+        while json.loads(await ws.recv())["type"] != "done":
+            pass
+        for turn in range(turns):
+            question = f"Client {client_index} question {turn}: what does section {turn} say about MTP?"
+            sent_at = time.perf_counter()
+            await ws.send(question)
+            first_at = None
+            text = ""
+            queued = False
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame["type"] == "queue":
+                    queued = True
+                    continue
+                if frame["type"] in ("stream", "delta") and first_at is None:
+                    first_at = time.perf_counter()
+                if frame["type"] == "delta":
+                    text += frame["content"]
+                elif frame["type"] == "stream":
+                    text = frame["content"]
+                elif frame["type"] == "done":
+                    break
+            done_at = time.perf_counter()
+            tokens = len(text.split())
+            stream_s = done_at - (first_at or done_at)
+            results.append({
+                "ttft_s": (first_at or done_at) - sent_at,
+                "latency_s": done_at - sent_at,
+                "tokens": tokens,
+                "tokens_per_s": tokens / stream_s if stream_s > 0 else None,
+                "queued": queued,
+            })
+    return results
+
+
+def serve(args, port, index_dir):
+    """Runs in the server process."""
+    import uvicorn
+
+    configure_app(args, index_dir)
+    import main
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+
+
+async def wait_ready(port, server, timeout=120.0):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+        while time.perf_counter() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError("server did not become ready")
+
+
+async def bench_chat(args, index_dir):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                               "--serve", str(port), index_dir], cwd=ROOT)
+    try:
+        await wait_ready(port, server)
+        rss_before = rss_mb(server.pid)
+        start = time.perf_counter()
+        per_client = await asyncio.gather(*(run_client(port, i, args.turns, args.protocol)
+                                            for i in range(args.clients)),
+                                          return_exceptions=True)
+        wall = time.perf_counter() - start
+        rss_after = rss_mb(server.pid)
+        rss_peak = rss_mb(server.pid, "VmHWM")
+    finally:
+        server.terminate()
+        server.wait()
+
+    turns = [turn for client in per_client if isinstance(client, list) for turn in client]
+    errors = [repr(client) for client in per_client if not isinstance(client, list)]
+    return {
+        "clients": args.clients,
+        "turns_per_client": args.turns,
+        "protocol": args.protocol,
+        "completed_turns": len(turns),
+        "errors": errors,
+        "wall_s": wall,
+        "turns_per_s": len(turns) / wall if wall else None,
+        "queued_turns": sum(turn["queued"] for turn in turns),
+        "ttft_s": summarize([turn["ttft_s"] for turn in turns]),
+        "turn_latency_s": summarize([turn["latency_s"] for turn in turns]),
+        "tokens_per_s": summarize([turn["tokens_per_s"] for turn in turns if turn["tokens_per_s"]]),
+        "worker_rss_mb": {"before": rss_before, "after": rss_after, "peak": rss_peak},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--protocol", default="2", choices=["1", "2"])
+    parser.add_argument("--token-rate", type=float, default=50.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--rewrite-ms", type=float, default=300.0)
+    parser.add_argument("--embedding-ms", type=float, default=50.0)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--answer-cache", action="store_true", help="leave the answer cache enabled")
+    parser.add_argument("--pdf", default=os.path.join(ROOT, "documents", "2412.19437v2.pdf"))
+    parser.add_argument("--skip-ingestion", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--serve", nargs=2, metavar=("PORT", "INDEX_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if args.serve:
+        serve(args, int(args.serve[0]), args.serve[1])
+        return
+    index_dir = tempfile.mkdtemp(prefix="bench-index-")
+    from fakes import FakeEmbeddings
+    embeddings = FakeEmbeddings(dimension=args.dimension)
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+    from local_vectordb import LocalVectorDB
+
+    if args.skip_ingestion:
+        from langchain.schema import Document
+        documents = [Document(page_content=f"Synthetic chunk {i} about MTP and MoE.", metadata={"page": i // 4 + 1})
+                     for i in range(200)]
+    else:
+        documents, results["ingestion"] = bench_ingestion(args.pdf)
+    # Seed the local index the chat retriever reads from
+    LocalVectorDB(None, "project-j-index", data_dir=index_dir, embeddings=embeddings).add_documents(documents, "bench.pdf")
+
+    results["chat"] = asyncio.run(bench_chat(args, index_dir))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
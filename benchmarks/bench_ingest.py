@@ -0,0 +1,98 @@
+"""Bulk embedding and upsert throughput against a local OpenAI-compatible fake embedding server.
+
+Serves ``fakes.fake_embedding_app`` with uvicorn and points a real
+``OpenAIEmbeddings`` client at it, so requests, 429 responses and Retry-After
+headers go through the same code path as production. Chunks from the sample
+paper (repeated ``--copies`` times under different file names) are indexed
+into a temporary ``LocalVectorDB`` with ``BulkIndexer`` for each
+``--in-flight`` setting, and chunks/s, batch counts and rate-limit handling
+are reported.
+
+Usage: python benchmarks/bench_ingest.py --copies 10 --in-flight 1 4 8 --server-tps 40000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chat import free_port
+
+
+async def run(args):
+    import uvicorn
+    from langchain_openai import OpenAIEmbeddings
+
+    from bulk_ingest import BulkIndexer, chunk_id
+    from fakes import fake_embedding_app
+    from local_vectordb import LocalVectorDB
+    from utils import PDFProcessor
+
+    documents = PDFProcessor(args.pdf).process()
+    items = [(f"copy{copy}.pdf", doc) for copy in range(args.copies) for doc in documents]
+
+    app = fake_embedding_app(dimension=args.dimension, latency_ms=args.latency_ms,
+                             ms_per_1k_tokens=args.ms_per_1k_tokens, tokens_per_second=args.server_tps)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # Client-side retries are off so rate limits reach BulkIndexer
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-large", api_key="benchmark",
+                                  base_url=f"http://127.0.0.1:{port}/v1",
+                                  check_embedding_ctx_length=False, max_retries=0)
+    results = []
+    for in_flight in args.in_flight:
+        db = LocalVectorDB(None, "bench", data_dir=tempfile.mkdtemp(prefix="bench-ingest-"), embeddings=embeddings)
+        indexer = BulkIndexer(embeddings, db.add_embeddings, max_batch_tokens=args.batch_tokens,
+                              max_in_flight=in_flight, backoff=0.2)
+        texts = [doc.page_content for _, doc in items]
+        metadatas = [{"text": doc.page_content, "source": source, **doc.metadata} for source, doc in items]
+        ids = [chunk_id(source, doc) for source, doc in items]
+        start = time.perf_counter()
+        await indexer.index(texts, metadatas, ids)
+        elapsed = time.perf_counter() - start
+        rows = db.count
+
+        # Indexing the same chunks again must not add rows (identical chunks of one page already share an id)
+        await BulkIndexer(embeddings, db.add_embeddings, max_in_flight=in_flight).index(texts, metadatas, ids)
+        results.append({"in_flight": in_flight, "chunks": len(texts), "seconds": elapsed,
+                        "chunks_per_s": len(texts) / elapsed, "rows": rows, "rows_after_rerun": db.count,
+                        **{key: indexer.describe()[key] for key in ("batches", "rate_limited", "shrinks", "grows",
+                                                                    "batch_tokens")}})
+        print(json.dumps(results[-1]))
+
+    server.should_exit = True
+    await server_task
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=os.path.join(ROOT, "documents", "2412.19437v2.pdf"))
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--batch-tokens", type=int, default=8000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="fixed server latency per request")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=20.0)
+    parser.add_argument("--server-tps", type=float, default=0.0, help="server token budget per second, 0 = unlimited")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Build time, on-disk size and query latency of the BM25 index, plus exact-term hit checks.
+
+Indexes the chunks PDFProcessor produces for the sample paper, then runs a set of
+queries against ``LexicalIndex.search`` and reports the latency percentiles and
+the confidence the hybrid retriever would compare to LEXICAL_SHORTCUT_CONFIDENCE.
+
+Usage: python benchmarks/bench_lexical.py [pdf_path] [--repeat N]
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex
+from utils import PDFProcessor
+
+# (query, term the top hit must contain)
+QUERIES = [
+    ("Table 3", "table 3"),
+    ("MTP", "mtp"),
+    ("DeepSeek-V3 training cost in H800 GPU hours", "h800"),
+    ("auxiliary-loss-free load balancing", "auxiliary-loss-free"),
+    ("FP8 mixed precision training framework", "fp8"),
+    ("What is multi-head latent attention?", "latent attention"),
+    ("DualPipe", "dualpipe"),
+    ("How many tokens was the model pre-trained on?", "tokens"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf_path", nargs="?", default="documents/2412.19437v2.pdf")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    documents = PDFProcessor(args.pdf_path).process()
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-bm25-"), "bench.bm25.json")
+    # Like timeit: a full collection over the langchain import heap would dwarf the index timings
+    gc.collect()
+    gc.disable()
+
+    start = time.perf_counter()
+    index = LexicalIndex(path)
+    index.update(added=((str(i), doc.page_content, doc.metadata) for i, doc in enumerate(documents)))
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    LexicalIndex(path)
+    load_s = time.perf_counter() - start
+
+    stats = index.describe()
+    print(f"build: {build_s * 1000:.1f} ms for {stats['chunks']} chunks, {stats['terms']} terms, "
+          f"{stats['postings']} postings")
+    print(f"load:  {load_s * 1000:.1f} ms, {stats['bytes_on_disk'] / 1024:.1f} KiB on disk "
+          f"({sum(len(doc.page_content) for doc in documents) / 1024:.1f} KiB of chunk text)")
+
+    for query, expected in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results, confidence = index.search(query, k=20)
+            timings.append(time.perf_counter() - start)
+        top = results[0][0].page_content.lower() if results else ""
+        timings.sort()
+        print(f"{query!r:50} p50 {statistics.median(timings) * 1e3:.3f} ms  "
+              f"p95 {timings[int(len(timings) * 0.95) - 1] * 1e3:.3f} ms  "
+              f"confidence {confidence:.2f}  top hit has {expected!r}: {expected in top}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compare serial and parallel PDF extraction on the ingestion path the server uses.
+
+Runs an ``IngestionManager`` job with one worker and with ``--workers`` (page
+batches through ``utils.extract_page_batch`` in the manager's spawn pool),
+indexing into a ``LocalVectorDB`` with fake embeddings so extraction dominates.
+The pool lives as long as the manager, like in the server, so each mode's
+first run (which starts the pool) is a warm-up and the best later run counts.
+
+Usage: python benchmarks/bench_pdf_extraction.py [pdf_path] [--workers N] [--runs R]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeEmbeddings
+from ingestion import IngestionManager
+from local_vectordb import LocalVectorDB
+
+
+def timed_job(manager, pdf_path):
+    vectordb = LocalVectorDB(None, "bench-index", data_dir=tempfile.mkdtemp(prefix="bench-extract-"),
+                             embeddings=FakeEmbeddings())
+    job = manager.create_job(os.path.basename(pdf_path), pdf_path)
+    start = time.perf_counter()
+    asyncio.run(manager.run(job, vectordb))
+    assert job.status == "completed", job.error
+    return time.perf_counter() - start, list(zip(vectordb.ids, vectordb.texts, vectordb.metadatas))
+
+
+def best_of(workers, pdf_path, runs, batch_pages):
+    manager = IngestionManager(batch_pages=batch_pages, workers=workers)
+    try:
+        results = [timed_job(manager, pdf_path) for _ in range(runs + 1)][1:]
+    finally:
+        manager.close()
+    return min(seconds for seconds, _ in results), results[-1][1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf_path", nargs="?", default="documents/2412.19437v2.pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--batch-pages", type=int, default=8)
+    args = parser.parse_args()
+
+    serial_s, serial_chunks = best_of(1, args.pdf_path, args.runs, args.batch_pages)
+    parallel_s, parallel_chunks = best_of(args.workers, args.pdf_path, args.runs, args.batch_pages)
+
+    print(f"serial:   {serial_s:.2f}s ({len(serial_chunks)} chunks)")
+    print(f"parallel: {parallel_s:.2f}s ({len(parallel_chunks)} chunks, {args.workers} workers, "
+          f"{os.cpu_count()} CPUs)")
+    print(f"speedup:  {serial_s / parallel_s:.2f}x, identical output: {serial_chunks == parallel_chunks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Peak RSS of PDF extraction as the page count grows: streaming vs all-at-once.
+
+Builds PDFs of ``--pages`` pages by repeating the sample paper, then extracts
+each one in a fresh subprocess, either by consuming
+``PDFProcessor.iter_documents()`` (``stream``) or by extracting every page's
+tables and chunks before converting them (``batch``, what each parallel shard
+does). Streaming peak RSS should stay flat as the page count grows.
+
+Usage: python benchmarks/bench_pdf_memory.py [pdf_path] --pages 50 200 1000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_pdf(source, pages, path):
+    import fitz
+
+    src = fitz.open(source)
+    out = fitz.open()
+    while len(out) < pages:
+        out.insert_pdf(src, to_page=min(len(src), pages - len(out)) - 1)
+    out.save(path)
+
+
+def measure(mode, pdf_path, chunk_tokens):
+    """Runs in the child process."""
+    from utils import PDFProcessor
+
+    processor = PDFProcessor(pdf_path, chunk_tokens=chunk_tokens)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "stream":
+        documents = sum(1 for _ in processor.iter_documents())
+    else:
+        processor.extract_tables()
+        processor.extract_text()
+        documents = len(processor.prepare_chunks_for_vectordb())
+    return {"documents": documents, "seconds": time.perf_counter() - start,
+            "baseline_rss_mb": baseline / 1024, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path", nargs="?", default=os.path.join(ROOT, "documents", "2412.19437v2.pdf"))
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--modes", nargs="+", default=["stream", "batch"], choices=["stream", "batch"])
+    parser.add_argument("--chunk-tokens", type=int, default=0)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PDF"), help=argparse.SUPPRESS)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], args.child[1], args.chunk_tokens)))
+        return
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench-pdf-memory-")
+    for pages in args.pages:
+        pdf_path = os.path.join(workdir, f"{pages}.pdf")
+        build_pdf(args.pdf_path, pages, pdf_path)
+        for mode in args.modes:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, pdf_path,
+                                     "--chunk-tokens", str(args.chunk_tokens)],
+                                    check=True, capture_output=True, text=True).stdout
+            results.append({"pages": pages, "mode": mode, **json.loads(output.strip().splitlines()[-1])})
+            result = results[-1]
+            print(f"{pages:5} pages  {mode:6}  {result['documents']:6} documents  {result['seconds']:7.1f}s  "
+                  f"peak RSS {result['peak_rss_mb']:7.1f} MiB (+{result['peak_rss_mb'] - result['baseline_rss_mb']:.1f})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
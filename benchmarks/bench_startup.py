@@ -0,0 +1,153 @@
+"""Cold start of the app: import time, time to first response and time until ``/ready``.
+
+Starts ``main.app`` with uvicorn in a fresh interpreter, with the local vector
+backend and the fake OpenAI clients from ``fakes``, and polls it from this
+process. ``lazy`` is the normal start-up (the retrieval stack is built by the
+background warm-up); ``eager`` builds it before serving, the way start-up
+worked before the warm-up hook. For each mode the time from spawn to the
+first ``GET /``, to ``/ready``, and to the first chat answer is reported, and
+``GET /`` is checked for a 304 on its ETag.
+
+Usage: python benchmarks/bench_startup.py --runs 3 --modes lazy eager
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chat import free_port
+
+
+def serve(mode, index_dir, port):
+    """Runs in the child process."""
+    from app_config import APP_CONFIG
+
+    APP_CONFIG.update({'openai_key': 'benchmark', 'vector_backend': 'local', 'local_index_dir': index_dir})
+    start = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - start
+
+    import registry
+
+    # The fakes (and the langchain_core they pull in) load when the registry is built, like the real clients
+    def create_embeddings(**kwargs):
+        from fakes import FakeEmbeddings
+        return FakeEmbeddings()
+
+    def create_llm(**kwargs):
+        from fakes import FakeStreamingChatModel
+        return FakeStreamingChatModel(answer_tokens=5, first_token_ms=0, rewrite_ms=0)
+
+    registry.create_embeddings = create_embeddings
+    registry.create_llm = create_llm
+    if mode == "eager":
+        main.registry.warm_up()
+        main.ingestion.warm_up()
+    print(json.dumps({"import_main_s": import_s, "eager_warmup_s": time.perf_counter() - start - import_s}),
+          flush=True)
+
+    import uvicorn
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def first_answer(port):
+    import websockets
+
+    async with websockets.connect(f"ws://127.0.0.1:{port}/chat/bench?protocol=2") as ws:
+        while json.loads(await ws.recv())["type"] != "done":
+            pass
+        await ws.send("What does the paper say about MTP?")
+        while json.loads(await ws.recv())["type"] != "done":
+            pass
+
+
+def measure(mode, index_dir, timeout, poll_interval):
+    import httpx
+
+    port = free_port()
+    spawned = time.perf_counter()
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", mode, index_dir, str(port)],
+                             cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    try:
+        # PyMuPDF prints a deprecation notice to stdout when it is imported
+        while not (line := child.stdout.readline()).startswith("{"):
+            pass
+        result = {"mode": mode, **json.loads(line)}
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            first_response = ready = None
+            while ready is None and time.perf_counter() - spawned < timeout:
+                try:
+                    if first_response is None:
+                        home = client.get("/")
+                        first_response = time.perf_counter() - spawned
+                    if client.get("/ready").status_code == 200:
+                        ready = time.perf_counter() - spawned
+                    else:
+                        # Polling flat out would compete with the warm-up thread for the CPU
+                        time.sleep(poll_interval)
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            asyncio.run(first_answer(port))
+            result.update({
+                "first_response_s": first_response,
+                "ready_s": ready,
+                "first_answer_s": time.perf_counter() - spawned,
+                "home_not_modified": client.get("/", headers={"If-None-Match": home.headers["etag"]}).status_code == 304,
+                "warmup_s": client.get("/ready").json()["warmup_seconds"],
+            })
+    finally:
+        child.terminate()
+        child.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["lazy", "eager"], choices=["lazy", "eager"])
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--poll-ms", type=float, default=100.0, help="interval between /ready probes")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "INDEX_DIR", "PORT"), help=argparse.SUPPRESS)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.child:
+        serve(args.child[0], args.child[1], int(args.child[2]))
+        return
+
+    from langchain.schema import Document
+    from fakes import FakeEmbeddings
+    from local_vectordb import LocalVectorDB
+
+    index_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    documents = [Document(page_content=f"Synthetic chunk {i} about MTP and MoE.", metadata={"page": i // 4 + 1})
+                 for i in range(200)]
+    LocalVectorDB(None, "project-j-index", data_dir=index_dir, embeddings=FakeEmbeddings()).add_documents(documents,
+                                                                                                         "bench.pdf")
+
+    results = []
+    for mode in args.modes:
+        runs = [measure(mode, index_dir, args.timeout, args.poll_ms / 1000) for _ in range(args.runs)]
+        results.extend(runs)
+        summary = {key: statistics.median(run[key] for run in runs)
+                   for key in ("import_main_s", "first_response_s", "ready_s", "first_answer_s")}
+        print(f"{mode:6} import main {summary['import_main_s']:.2f}s  first response {summary['first_response_s']:.2f}s  "
+              f"ready {summary['ready_s']:.2f}s  first answer {summary['first_answer_s']:.2f}s  "
+              f"(median of {args.runs}; ETag 304: {all(run['home_not_modified'] for run in runs)})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Table recall and extraction time of the PyMuPDF table pre-screen against the full pdfplumber scan.
+
+Runs ``PDFProcessor.extract_tables`` with ``strict_tables=True`` (every page
+through pdfplumber) and with the default screen, compares the table ids each
+finds, then times the whole ``process()`` in both modes.
+
+Usage: python benchmarks/bench_table_screen.py [pdf_path ...] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import PDFProcessor
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def tables(pdf_path, strict):
+    processor = PDFProcessor(pdf_path, strict_tables=strict)
+    seconds, _ = timed(processor.extract_tables)
+    ids = {id_ for page_tables in processor.tables_by_page.values() for id_, _ in page_tables}
+    return seconds, ids, sorted(processor.tables_by_page)
+
+
+def compare(pdf_path):
+    strict_s, strict_ids, table_pages = tables(pdf_path, strict=True)
+    screened_s, screened_ids, _ = tables(pdf_path, strict=False)
+    processor = PDFProcessor(pdf_path)
+    screen_s, candidates = timed(processor.table_pages)
+
+    strict_total, strict_docs = timed(PDFProcessor(pdf_path, strict_tables=True).process)
+    screened_total, screened_docs = timed(PDFProcessor(pdf_path).process)
+    return {
+        "pdf": os.path.basename(pdf_path),
+        "pages": len(processor.doc),
+        "table_pages": len(table_pages),
+        "candidate_pages": len(candidates),
+        "missed_pages": sorted(set(table_pages) - set(candidates)),
+        "tables": len(strict_ids),
+        "recall": len(strict_ids & screened_ids) / len(strict_ids) if strict_ids else 1.0,
+        "screen_s": screen_s,
+        "tables_strict_s": strict_s,
+        "tables_screened_s": screened_s,
+        "process_strict_s": strict_total,
+        "process_screened_s": screened_total,
+        "identical_documents": [(d.page_content, d.metadata) for d in strict_docs] ==
+                               [(d.page_content, d.metadata) for d in screened_docs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_paths", nargs="*", default=[os.path.join(ROOT, "documents", "2412.19437v2.pdf")])
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = []
+    for pdf_path in args.pdf_paths:
+        result = compare(pdf_path)
+        results.append(result)
+        print(f"{result['pdf']}: {result['candidate_pages']}/{result['pages']} pages screened in "
+              f"({result['table_pages']} with tables, missed {result['missed_pages']}), "
+              f"table recall {result['recall']:.2%} of {result['tables']}")
+        print(f"  tables:  {result['tables_strict_s']:.2f}s strict -> {result['tables_screened_s']:.2f}s screened "
+              f"(screen {result['screen_s']:.2f}s)")
+        print(f"  process: {result['process_strict_s']:.2f}s strict -> {result['process_screened_s']:.2f}s screened, "
+              f"identical documents: {result['identical_documents']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
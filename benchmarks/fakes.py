@@ -0,0 +1,136 @@
+"""In-process stand-ins for the OpenAI chat model and embeddings used by the benchmarks."""
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic unit vectors derived from a hash of the text."""
+
+    def __init__(self, dimension: int = 256, latency_ms: float = 0.0, **kwargs: Any):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int(hashlib.sha256(text.encode()).hexdigest()[:16], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model that streams ``answer_tokens`` tokens at ``tokens_per_second``.
+
+    Non-streaming calls (the question rewrite) return the last human message after ``rewrite_ms``.
+    """
+
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 100
+    first_token_ms: float = 300.0
+    rewrite_ms: float = 300.0
+
+    def __init__(self, **kwargs: Any):
+        fields = {key: kwargs[key] for key in ("tokens_per_second", "answer_tokens", "first_token_ms", "rewrite_ms")
+                  if key in kwargs}
+        super().__init__(**fields)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _rewrite(self, messages: List[BaseMessage]) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=str(messages[-1].content)))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.rewrite_ms / 1000)
+        return self._rewrite(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.rewrite_ms / 1000)
+        return self._rewrite(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_ms / 1000)
+        for i in range(self.answer_tokens):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=f"tok{i} "))
+            time.sleep(1 / self.tokens_per_second)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for i in range(self.answer_tokens):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=f"tok{i} "))
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+
+def fake_embedding_app(dimension: int = 256, latency_ms: float = 20.0, ms_per_1k_tokens: float = 5.0,
+                       tokens_per_second: float = 0.0):
+    """FastAPI app serving ``POST /v1/embeddings`` like the OpenAI API, for ``OpenAIEmbeddings(base_url=...)``.
+
+    With ``tokens_per_second`` set, a token bucket holding one second of budget
+    answers over-budget requests with HTTP 429 and a ``Retry-After`` header.
+    """
+    import base64
+
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    embeddings = FakeEmbeddings(dimension=dimension)
+    bucket = {"tokens": tokens_per_second, "at": time.monotonic()}
+    app.state.stats = {"requests": 0, "rate_limited": 0, "texts": 0}
+
+    @app.post("/v1/embeddings")
+    async def create(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        app.state.stats["requests"] += 1
+        if tokens_per_second:
+            now = time.monotonic()
+            bucket["tokens"] = min(tokens_per_second, bucket["tokens"] + (now - bucket["at"]) * tokens_per_second)
+            bucket["at"] = now
+            if tokens > bucket["tokens"]:
+                app.state.stats["rate_limited"] += 1
+                wait = (tokens - bucket["tokens"]) / tokens_per_second
+                return JSONResponse(status_code=429, headers={"retry-after": f"{wait:.3f}"},
+                                    content={"error": {"message": "Rate limit reached", "type": "tokens",
+                                                       "code": "rate_limit_exceeded"}})
+            bucket["tokens"] -= tokens
+        await asyncio.sleep((latency_ms + ms_per_1k_tokens * tokens / 1000) / 1000)
+        app.state.stats["texts"] += len(texts)
+        data = []
+        for index, text in enumerate(texts):
+            vector = embeddings._vector(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        return {"object": "list", "data": data, "model": body.get("model", "fake"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return app
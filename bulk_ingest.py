@@ -0,0 +1,220 @@
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from langchain.schema import Document
+from metrics import metrics
+import asyncio
+import random
+import time
+import uuid
+
+# Namespace for chunk ids, so the same chunk of the same file always gets the same id
+CHUNK_NAMESPACE = uuid.UUID("5b0c6f3e-9f0a-4d5e-8a57-1d1f3c2b9e41")
+
+
+def chunk_id(source: str, doc: Document) -> str:
+    """Deterministic id of a chunk: records that already carry an id (tables) keep it."""
+    if doc.id:
+        return doc.id
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}\n{doc.metadata.get('page')}\n{doc.page_content}"))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """HTTP 429 from OpenAI (``status_code``) or Pinecone (``status``)."""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BulkIndexer:
+    """Embed and upsert chunks in token-sized batches with several batches in flight.
+
+    Chunks are queued with ``submit`` and taken off the queue in batches of at
+    most ``batch_tokens`` estimated tokens and ``max_batch_size`` texts. A
+    rate-limited embedding call puts its batch back at the head of the queue,
+    halves ``batch_tokens`` (once per wave of 429s) and pauses every worker for
+    the backoff, at least ``Retry-After``, so the retries do not hit the limit
+    together. After ``grow_after`` clean batches the limit grows back by a
+    quarter. Upserts are retried with the same backoff. ``slot`` wraps each
+    embedding call, e.g. in a scheduler slot; ``on_batch`` is called after
+    each upsert.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        upsert: Callable[[List[str], List[List[float]], List[Dict[str, Any]], List[str]], Any],
+        max_batch_tokens: int = 8000,
+        max_batch_size: int = 128,
+        max_in_flight: int = 4,
+        max_retries: int = 6,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+        min_batch_tokens: int = 256,
+        grow_after: int = 4,
+        slot: Optional[Callable[[], Any]] = None,
+        on_batch: Optional[Callable[[List[str], List[Dict[str, Any]], List[str]], None]] = None
+    ):
+        self.embeddings = embeddings
+        self.upsert = upsert
+        self.max_batch_tokens = max_batch_tokens
+        self.batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.min_batch_tokens = min_batch_tokens
+        self.grow_after = grow_after
+        self.slot = slot or nullcontext
+        self.on_batch = on_batch
+        self.pending: Deque[Tuple[str, Dict[str, Any], str]] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._clean_batches = 0
+        self._resume_at = 0.0
+        self._shrunk_at = 0.0
+        self.stats: Dict[str, float] = {"chunks": 0, "batches": 0, "rate_limited": 0, "upsert_retries": 0,
+                                        "shrinks": 0, "grows": 0, "seconds": 0.0}
+
+    def submit(self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str]) -> None:
+        self.pending.extend(zip(texts, metadatas, ids))
+        self._ready.set()
+
+    def close(self) -> None:
+        """No more chunks will be submitted; ``run`` returns once the queue is drained."""
+        self._closed = True
+        self._ready.set()
+
+    async def run(self) -> None:
+        start = time.perf_counter()
+        try:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(self.max_in_flight):
+                    group.create_task(self._worker())
+        finally:
+            self.stats["seconds"] += time.perf_counter() - start
+
+    async def index(self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str]) -> List[str]:
+        self.submit(texts, metadatas, ids)
+        self.close()
+        await self.run()
+        return ids
+
+    def _take(self) -> List[Tuple[str, Dict[str, Any], str]]:
+        batch = []
+        tokens = 0
+        while self.pending and len(batch) < self.max_batch_size:
+            cost = estimate_tokens(self.pending[0][0])
+            # A single oversized chunk still goes out on its own
+            if batch and tokens + cost > self.batch_tokens:
+                break
+            batch.append(self.pending.popleft())
+            tokens += cost
+        return batch
+
+    def _delay(self, attempt: int, error: BaseException) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+        return max(delay, retry_after(error) or 0.0)
+
+    async def _cool_down(self) -> None:
+        while (wait := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+
+    async def _worker(self) -> None:
+        attempt = 0
+        while True:
+            batch = self._take()
+            if not batch:
+                if self._closed:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            texts = [text for text, _, _ in batch]
+            try:
+                await self._cool_down()
+                sent_at = time.monotonic()
+                async with self.slot():
+                    with metrics.timer("ingest_embed"):
+                        vectors = await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                self.pending.extendleft(reversed(batch))
+                self._shrink(sent_at)
+                self.stats["rate_limited"] += 1
+                metrics.inc("ingest_rate_limited_total")
+                self._resume_at = max(self._resume_at, time.monotonic() + self._delay(attempt, e))
+                attempt += 1
+                continue
+
+            attempt = 0
+            await self._upsert(texts, vectors, [metadata for _, metadata, _ in batch], [id_ for _, _, id_ in batch])
+            self._grow()
+
+    async def _upsert(self, texts, vectors, metadatas, ids) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self.upsert, texts, vectors, metadatas, ids)
+                break
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                self.stats["upsert_retries"] += 1
+                await asyncio.sleep(self._delay(attempt, e))
+        self.stats["chunks"] += len(texts)
+        self.stats["batches"] += 1
+        metrics.inc("ingest_chunks_total", len(texts))
+        if self.on_batch is not None:
+            self.on_batch(texts, metadatas, ids)
+
+    def _shrink(self, sent_at: float) -> None:
+        self._clean_batches = 0
+        # Calls already in flight when the limit last shrank do not shrink it again
+        if sent_at < self._shrunk_at:
+            return
+        self._shrunk_at = time.monotonic()
+        if self.batch_tokens > self.min_batch_tokens:
+            self.batch_tokens = max(self.min_batch_tokens, self.batch_tokens // 2)
+            self.stats["shrinks"] += 1
+
+    def _grow(self) -> None:
+        self._clean_batches += 1
+        if self._clean_batches >= self.grow_after and self.batch_tokens < self.max_batch_tokens:
+            self.batch_tokens = min(self.max_batch_tokens, int(self.batch_tokens * 1.25))
+            self._clean_batches = 0
+            self.stats["grows"] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        seconds = self.stats["seconds"]
+        return {
+            "batch_tokens": self.batch_tokens,
+            "max_in_flight": self.max_in_flight,
+            "chunks_per_s": self.stats["chunks"] / seconds if seconds else None,
+            **self.stats,
+        }
+
+
+async def bulk_add_documents(vectordb, documents: List[Document], filename: str, **kwargs) -> List[str]:
+    """Bulk counterpart of ``add_documents`` for ``PineconeDB`` and ``LocalVectorDB``."""
+    texts = [doc.page_content for doc in documents]
+    metadatas = [{"text": doc.page_content, "source": filename, **doc.metadata} for doc in documents]
+    ids = [chunk_id(filename, doc) for doc in documents]
+    indexer = BulkIndexer(vectordb.embeddings, vectordb.add_embeddings, **kwargs)
+    await indexer.index(texts, metadatas, ids)
+    await asyncio.to_thread(vectordb.lexical.update, zip(ids, texts, metadatas))
+    return ids
@@ -1,13 +1,18 @@
 from fastapi import WebSocket
-from typing import NoReturn
+from typing import NoReturn, Optional
 import asyncio
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
 import hashlib
 import time
 
 
+STREAM_TYPES = ("stream", "delta")
+SLOW_CONSUMER_POLICIES = ("coalesce", "disconnect")
+
+
 def create_unique_id(session_id: str) -> str:
-   
+
     return hashlib.sha256(session_id.encode()).hexdigest()[:10]
 
 @dataclass
@@ -16,11 +21,44 @@ class Connection:
     unique_id: str
     websocket: WebSocket
     connected: bool = True  # New flag to track connection state
+    queue: deque = field(default_factory=deque)  # Outbound frames waiting for the writer task
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    drained: asyncio.Event = field(default_factory=asyncio.Event)
+    writer: Optional[asyncio.Task] = None
+    sent: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    max_depth: int = 0
+
+    def stats(self) -> dict:
+        return {
+            "unique_id": self.unique_id,
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
 
 class ConnectionManager:
-    def __init__(self):
+    """Tracks WebSocket connections; each one has a bounded outbound queue drained by its own writer task.
+
+    When a queue is full the slow-consumer policy decides what happens to new stream frames:
+    ``coalesce`` folds them into the newest pending frame (a cumulative frame replaces the
+    one it supersedes, deltas are concatenated) and ``disconnect`` closes the connection.
+    Discarding frames outright is not offered: both protocols would lose answer text.
+    Control frames such as ``done`` are always queued.
+    """
+
+    def __init__(self, max_queue: int = 64, policy: str = "coalesce", send_timeout: float = 10.0, retry_count: int = 3):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy: {policy} (expected one of {SLOW_CONSUMER_POLICIES})")
         self.active_connections: dict[str, Connection] = {}
         self.client_connections: dict[str, set[str]] = {}
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.retry_count = retry_count
 
     async def connect(self, client_id: str, websocket: WebSocket) -> tuple[str, str]:
         await websocket.accept()
@@ -32,6 +70,8 @@ class ConnectionManager:
             websocket=websocket,
             connected=True  # Mark connection as active
         )
+        connection.drained.set()
+        connection.writer = asyncio.create_task(self._writer(connection))
         self.active_connections[unique_id] = connection
         if client_id not in self.client_connections:
             self.client_connections[client_id] = set()
@@ -41,28 +81,95 @@ class ConnectionManager:
     async def disconnect(self, unique_id: str, reason: str = "Connection closed"):
         if unique_id in self.active_connections:
             connection = self.active_connections[unique_id]
-            if connection.connected:  
-                connection.connected = False  # Mark connection as inactive
-                await connection.websocket.close(code=1000, reason=reason)
-            client_id = connection.session_id.split("-")[0]
-            self.client_connections[client_id].remove(unique_id)
+            from_writer = asyncio.current_task() is connection.writer
+            if connection.connected and not from_writer and connection.queue:
+                # Give the writer a moment to flush frames queued before the close
+                try:
+                    await asyncio.wait_for(connection.drained.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+            if unique_id not in self.active_connections:
+                return
             del self.active_connections[unique_id]
+            client_id = connection.session_id.split("-")[0]
+            self.client_connections[client_id].discard(unique_id)
+            if not self.client_connections[client_id]:
+                del self.client_connections[client_id]
+            if connection.writer is not None and not from_writer:
+                connection.writer.cancel()
+            if connection.connected:
+                connection.connected = False  # Mark connection as inactive
+                try:
+                    await connection.websocket.close(code=1000, reason=reason)
+                except Exception:
+                    pass  # The socket may already be gone
 
-    async def send_json(self, unique_id: str, message: dict, retry_count: int = 3) -> NoReturn:
+    async def send_json(self, unique_id: str, message: dict) -> NoReturn:
+        """Queue ``message`` for the connection's writer task; never waits on the socket."""
         if unique_id not in self.active_connections:
             return
-        
+
         connection = self.active_connections[unique_id]
-        if not connection.connected:  
+        if not connection.connected:
             return  # Prevent sending to closed connections
 
-        for attempt in range(retry_count):
+        if len(connection.queue) >= self.max_queue and message.get("type") in STREAM_TYPES:
+            if self.policy == "disconnect":
+                await self.disconnect(unique_id, "Client too slow")
+                return
+            if self._absorb(connection, message):
+                return
+
+        connection.queue.append(message)
+        connection.max_depth = max(connection.max_depth, len(connection.queue))
+        connection.drained.clear()
+        connection.ready.set()
+
+    def _absorb(self, connection: Connection, message: dict) -> bool:
+        """Fold a stream frame into the newest pending one of the same type, if any."""
+        last = connection.queue[-1]
+        if last.get("type") != message.get("type"):
+            return False
+        if message["type"] == "delta":
+            # Keep the pending frame's seq: a seq 0 tells the client a new answer starts
+            last["content"] += message["content"]
+            connection.coalesced += 1
+        else:
+            # Cumulative frames supersede each other
+            connection.queue[-1] = message
+            connection.coalesced += 1
+        return True
+
+    async def _writer(self, connection: Connection):
+        while connection.connected:
+            if not connection.queue:
+                connection.drained.set()
+                connection.ready.clear()
+                await connection.ready.wait()
+                continue
+            message = connection.queue.popleft()
+            if not await self._send(connection, message):
+                return
+
+    async def _send(self, connection: Connection, message: dict) -> bool:
+        for attempt in range(self.retry_count):
             try:
-                await connection.websocket.send_json(message)
-                break
+                await asyncio.wait_for(connection.websocket.send_json(message), timeout=self.send_timeout)
+                connection.sent += 1
+                return True
             except Exception as e:
-                if attempt < retry_count - 1:
+                if attempt < self.retry_count - 1:
                     await asyncio.sleep(2 ** attempt)
                     continue
-                await self.disconnect(unique_id, f"Failed to send message: {str(e)}")
-                break
+                connection.dropped += 1 + len(connection.queue)
+                connection.queue.clear()
+                await self.disconnect(connection.unique_id, f"Failed to send message: {str(e)}")
+                return False
+
+    def describe(self) -> dict:
+        return {
+            "active_connections": len(self.active_connections),
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "connections": [connection.stats() for connection in self.active_connections.values()],
+        }
@@ -0,0 +1,224 @@
+from dataclasses import dataclass, field, asdict
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from scheduler import FairScheduler
+from metrics import metrics
+import asyncio
+import uuid
+import time
+
+# PyMuPDF, pdfplumber and langchain load on the first upload (or in ``warm_up``), not on import
+if TYPE_CHECKING:
+    from utils import PDFProcessor
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    filename: str
+    file_path: str
+    file_hash: str = ""
+    status: str = "queued"  # queued -> running -> completed | failed
+    pages_total: int = 0
+    pages_done: int = 0
+    chunks_embedded: int = 0
+    vectors_upserted: int = 0
+    pages_skipped: int = 0
+    vectors_deleted: int = 0
+    embed_batches: int = 0
+    rate_limited: int = 0
+    document_ids: List[str] = field(default_factory=list)
+    page_ids: Dict[int, List[str]] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def progress(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("file_path")
+        data["total_chunks"] = len(data.pop("document_ids"))
+        data.pop("page_ids")
+        return data
+
+
+class IngestionManager:
+    """Runs uploads as background jobs with overlapping extract and embed/upsert stages.
+
+    Extracted page batches go through a small bounded queue to a
+    ``BulkIndexer``, which embeds and upserts token-sized batches with
+    ``in_flight`` of them running at once. Only pages whose content hash
+    differs from the document manifest are re-indexed; vectors of changed or
+    removed pages are deleted once the new ones are in. Chunk ids are
+    deterministic, so a retried upload overwrites instead of duplicating.
+    The new chunks are added to the BM25 index in one write at the end.
+
+    With ``workers`` > 1 page batches are extracted in a process pool that
+    lives as long as the manager. It uses the spawn start method, because
+    forking the threaded server can deadlock. A failed or cancelled job
+    cancels its queued batches instead of waiting for them.
+    """
+
+    def __init__(self, batch_pages: int = 8, workers: int = 1, queue_depth: int = 2, max_jobs: int = 100,
+                 scheduler: Optional[FairScheduler] = None, batch_tokens: int = 8000, batch_size: int = 128,
+                 in_flight: int = 4, max_retries: int = 6, chunk_tokens: int = 0, strict_tables: bool = False):
+        self.batch_pages = batch_pages
+        self.workers = workers
+        self.chunk_tokens = chunk_tokens
+        self.strict_tables = strict_tables
+        self.scheduler = scheduler
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.in_flight = in_flight
+        self.max_retries = max_retries
+        self.queue_depth = queue_depth
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks: set = set()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self) -> None:
+        """Stop the extraction pool without blocking on batches still queued or running."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def create_job(self, filename: str, file_path: str, file_hash: str = "") -> IngestionJob:
+        job = IngestionJob(job_id=uuid.uuid4().hex, filename=filename, file_path=file_path, file_hash=file_hash)
+        self.jobs[job.job_id] = job
+        # Forget the oldest finished jobs once the table is full
+        while len(self.jobs) > self.max_jobs:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest.status not in ("completed", "failed"):
+                break
+            del self.jobs[oldest_id]
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def warm_up(self) -> None:
+        """Import the PDF extraction and indexing stack ahead of the first upload."""
+        import utils
+        import bulk_ingest
+
+    def start(self, job: IngestionJob, vectordb) -> None:
+        task = asyncio.create_task(self.run(job, vectordb))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self, job: IngestionJob, vectordb) -> None:
+        from utils import PDFProcessor
+
+        job.status = "running"
+        try:
+            processor = await asyncio.to_thread(PDFProcessor, job.file_path, chunk_tokens=self.chunk_tokens,
+                                              strict_tables=self.strict_tables)
+            job.pages_total = len(processor.doc)
+            page_hashes = await asyncio.to_thread(processor.page_hashes)
+            # The Pinecone manifest may have to be re-read from the index
+            previous = await asyncio.to_thread(vectordb.manifest.page_hashes, job.filename)
+            changed = [page for page, page_hash in page_hashes.items() if previous.get(page) != page_hash]
+            removed = [page for page in previous if page not in page_hashes]
+            job.pages_skipped = job.pages_total - len(changed)
+            job.pages_done = job.pages_skipped
+
+            extracted: asyncio.Queue = asyncio.Queue(maxsize=self.queue_depth)
+            lexical: list = []
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._extract(job, processor, [page - 1 for page in changed], extracted))
+                group.create_task(self._index(job, vectordb, extracted, lexical))
+
+            stale_ids = await asyncio.to_thread(vectordb.manifest.page_ids, job.filename,
+                                                [page for page in changed + removed if page in previous])
+            # Records with stable ids (tables) that were just re-upserted are not stale
+            fresh_ids = set(job.document_ids)
+            stale_ids = [id_ for id_ in stale_ids if id_ not in fresh_ids]
+            if stale_ids:
+                await asyncio.to_thread(vectordb.delete_documents, stale_ids)
+                job.vectors_deleted = len(stale_ids)
+            with metrics.timer("ingest_lexical_index"):
+                await asyncio.to_thread(vectordb.lexical.update, lexical)
+            for page in changed:
+                job.page_ids.setdefault(page, [])
+            await asyncio.to_thread(vectordb.manifest.record, job.filename, job.file_hash, page_hashes, job.page_ids)
+            job.status = "completed"
+        except BaseException as e:
+            # TaskGroup wraps stage failures in an ExceptionGroup
+            errors = getattr(e, "exceptions", [e])
+            job.error = "; ".join(str(err) for err in errors)
+            job.status = "failed"
+            print(job.error)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            job.finished_at = time.time()
+
+    async def _extract(self, job: IngestionJob, processor: "PDFProcessor", pages: List[int], out: asyncio.Queue) -> None:
+        from utils import extract_page_batch
+
+        batches = [pages[start:start + self.batch_pages] for start in range(0, len(pages), self.batch_pages)]
+        if self.workers > 1:
+            # Page batches are extracted across processes and consumed in page order
+            loop = asyncio.get_running_loop()
+            pool = self._executor()
+            futures = [loop.run_in_executor(pool, extract_page_batch, job.file_path, batch, self.chunk_tokens,
+                                            self.strict_tables)
+                       for batch in batches]
+            try:
+                for future, batch in zip(futures, batches):
+                    await self._emit(job, await future, len(batch), out)
+            finally:
+                # Batches that have not started are dropped; the event loop never waits on the pool
+                for future in futures:
+                    future.cancel()
+        else:
+            for batch in batches:
+                documents = await asyncio.to_thread(processor.process_pages, batch)
+                await self._emit(job, documents, len(batch), out)
+        await out.put(None)
+
+    async def _emit(self, job: IngestionJob, documents, batch_pages: int, out: asyncio.Queue) -> None:
+        job.pages_done += batch_pages
+        if documents:
+            await out.put(documents)
+
+    def _slot(self, job: IngestionJob):
+        if self.scheduler is None:
+            return None
+        # Share upstream concurrency with chat turns; ingestion waits instead of being rejected
+        return lambda: self.scheduler.slot(f"ingest:{job.job_id}", timeout=None, bounded=False)
+
+    async def _index(self, job: IngestionJob, vectordb, inbox: asyncio.Queue, lexical: list) -> None:
+        from bulk_ingest import BulkIndexer, chunk_id
+
+        def on_batch(texts, metadatas, ids):
+            job.chunks_embedded += len(texts)
+            job.vectors_upserted += len(ids)
+            job.embed_batches = int(indexer.stats["batches"])
+            job.rate_limited = int(indexer.stats["rate_limited"])
+            job.document_ids.extend(ids)
+            lexical.extend(zip(ids, texts, metadatas))
+            for id_, metadata in zip(ids, metadatas):
+                job.page_ids.setdefault(metadata["page"], []).append(id_)
+
+        indexer = BulkIndexer(vectordb.embeddings, vectordb.add_embeddings,
+                              max_batch_tokens=self.batch_tokens,
+                              max_batch_size=self.batch_size,
+                              max_in_flight=self.in_flight,
+                              max_retries=self.max_retries,
+                              slot=self._slot(job),
+                              on_batch=on_batch)
+        async with asyncio.TaskGroup() as group:
+            group.create_task(indexer.run())
+            while (documents := await inbox.get()) is not None:
+                indexer.submit([doc.page_content for doc in documents],
+                               [{"text": doc.page_content, "source": job.filename, **doc.metadata} for doc in documents],
+                               [chunk_id(job.filename, doc) for doc in documents])
+            indexer.close()
@@ -0,0 +1,215 @@
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+from langchain.schema import Document
+import threading
+import heapq
+import json
+import math
+import os
+import re
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have how i if in into is it its
+me my of on or our so than that the their them then there these they this to was we were what when where
+which who why will with would you your about also any each many more most other some such only own same
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; model names and numbers such as ``deepseek-v3`` or ``14.8t`` stay whole."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """BM25 inverted index over the ingested chunks, persisted next to the document manifest.
+
+    Chunks live in numbered slots; postings map each term to ``{slot: term
+    frequency}``. Chunk texts and metadata are kept so lexical results can be
+    served without touching the vector store. Deleted slots are reused and
+    compacted away on save. The file on disk is re-read when another process
+    (or another ``LexicalIndex`` on the same path) has written it.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._clear()
+        self.reload()
+
+    def _clear(self) -> None:
+        self.ids: List[Optional[str]] = []
+        self.texts: List[Optional[str]] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.slot_of: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.total_length = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.slot_of)
+
+    # -- persistence -----------------------------------------------------
+
+    def reload(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        self._clear()
+        self.ids = data["ids"]
+        self.texts = data["texts"]
+        self.metadatas = data["metadatas"]
+        self.lengths = data["lengths"]
+        # Postings are stored flat as [slot, tf, slot, tf, ...]
+        self.postings = {term: dict(zip(flat[::2], flat[1::2])) for term, flat in data["postings"].items()}
+        self.slot_of = {id_: slot for slot, id_ in enumerate(self.ids)}
+        self.total_length = sum(self.lengths)
+        self._mtime = self.path.stat().st_mtime
+
+    def refresh(self) -> None:
+        """Pick up writes made through another handle on the same file."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            with self._lock:
+                self.reload()
+
+    def _compact(self) -> None:
+        live = [slot for slot, id_ in enumerate(self.ids) if id_ is not None]
+        if len(live) == len(self.ids):
+            return
+        new_slot = {old: new for new, old in enumerate(live)}
+        self.ids = [self.ids[slot] for slot in live]
+        self.texts = [self.texts[slot] for slot in live]
+        self.metadatas = [self.metadatas[slot] for slot in live]
+        self.lengths = [self.lengths[slot] for slot in live]
+        self.postings = {term: {new_slot[slot]: tf for slot, tf in postings.items()}
+                         for term, postings in self.postings.items()}
+        self.slot_of = {id_: slot for slot, id_ in enumerate(self.ids)}
+        self.free = []
+
+    def _save(self) -> None:
+        self._compact()
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "ids": self.ids,
+                "texts": self.texts,
+                "metadatas": self.metadatas,
+                "lengths": self.lengths,
+                "postings": {term: [x for pair in postings.items() for x in pair]
+                             for term, postings in self.postings.items()},
+            }, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    # -- write path ------------------------------------------------------
+
+    def _add(self, id_: str, text: str, metadata: Dict[str, Any]) -> None:
+        if id_ in self.slot_of:
+            self._delete(id_)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        metadata = {key: value for key, value in metadata.items() if key != "text"}
+        if self.free:
+            slot = self.free.pop()
+            self.ids[slot], self.texts[slot], self.metadatas[slot], self.lengths[slot] = id_, text, metadata, length
+        else:
+            slot = len(self.ids)
+            self.ids.append(id_)
+            self.texts.append(text)
+            self.metadatas.append(metadata)
+            self.lengths.append(length)
+        self.slot_of[id_] = slot
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[slot] = tf
+
+    def _delete(self, id_: str) -> None:
+        slot = self.slot_of.pop(id_, None)
+        if slot is None:
+            return
+        for term in set(tokenize(self.texts[slot])):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(slot, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths[slot]
+        self.ids[slot] = self.texts[slot] = self.metadatas[slot] = None
+        self.lengths[slot] = 0
+        self.free.append(slot)
+
+    def update(
+        self,
+        added: Iterable[Tuple[str, str, Dict[str, Any]]] = (),
+        deleted: Iterable[str] = ()
+    ) -> None:
+        """Apply ``(id, text, metadata)`` additions and id deletions, then persist."""
+        with self._lock:
+            # Merge onto whatever another handle wrote since this one loaded
+            try:
+                if self.path.stat().st_mtime != self._mtime:
+                    self.reload()
+            except FileNotFoundError:
+                pass
+            for id_ in deleted:
+                self._delete(id_)
+            for id_, text, metadata in added:
+                self._add(id_, text, metadata)
+            self._save()
+
+    # -- read path -------------------------------------------------------
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 4,
+               where: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Tuple[List[Tuple[Document, float]], float]:
+        """Top-``k`` ``(document, bm25 score)`` pairs and the confidence of the best hit.
+
+        Confidence is the best score divided by the score a chunk would get by
+        containing every query term at saturation, so it lies in [0, 1).
+        ``where`` restricts the results to chunks whose metadata it accepts;
+        term statistics stay those of the whole index.
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            terms = [term for term in query_terms if term in self.postings]
+            if not terms or not self.count:
+                return [], 0.0
+            average_length = self.total_length / self.count or 1
+            scores: Dict[int, float] = {}
+            for term in terms:
+                idf = self._idf(term)
+                for slot, tf in self.postings[term].items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[slot] / average_length)
+                    scores[slot] = scores.get(slot, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            if where is not None:
+                scores = {slot: score for slot, score in scores.items() if where(self.metadatas[slot])}
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            # Query terms that never occur in the corpus count against confidence too
+            ceiling = sum(self._idf(term) * (self.k1 + 1) for term in query_terms)
+            results = [(Document(id=self.ids[slot], page_content=self.texts[slot], metadata=dict(self.metadatas[slot])), score)
+                       for slot, score in best]
+        return results, (best[0][1] / ceiling if best and ceiling else 0.0)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.count,
+            "terms": len(self.postings),
+            "postings": sum(len(postings) for postings in self.postings.values()),
+            "bytes_on_disk": self.path.stat().st_size if self.path.exists() else 0,
+        }
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+import time
+import re
+
+_ANY = object()
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+@dataclass
+class CacheEntry:
+    answer: str
+    embedding: Optional[np.ndarray]
+    created_at: float
+    scope: Optional[str] = None
+
+
+class AnswerCache:
+    """LRU/TTL cache of answers keyed on the standalone question.
+
+    Lookups try the normalised question first, then the closest cached question
+    by cosine similarity of their embeddings. All entries are dropped when
+    ``version_fn`` (the document manifest version) changes. Answers given
+    within a ``scope`` (e.g. a set of documents) only match lookups in the
+    same scope.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        version_fn: Callable[[], Any] = lambda: None,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 512,
+        ttl: float = 3600
+    ):
+        self.embeddings = embeddings
+        self.version_fn = version_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.version = None
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list = []
+        self._matrix_scopes: list = []
+        self.stats: Dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self) -> None:
+        version = self.version_fn()
+        if version != self.version:
+            if self.entries:
+                self.stats["invalidations"] += 1
+            self.entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        # Entries are kept in insertion/recency order, but TTL is on creation time
+        expired = [key for key, entry in self.entries.items() if entry.created_at < cutoff]
+        for key in expired:
+            del self.entries[key]
+            self.stats["evictions"] += 1
+        if expired:
+            self._matrix = None
+
+    async def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        vector = np.asarray(await self.embeddings.aembed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    @staticmethod
+    def _key(question: str, scope: Optional[str]) -> str:
+        key = normalize_question(question)
+        return key if scope is None else f"{scope}\n{key}"
+
+    def _nearest(self, vector: np.ndarray, scope: Optional[str] = None) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self.entries.items() if entry.embedding is not None]
+            self._matrix_scopes = [self.entries[key].scope for key in self._matrix_keys]
+            self._matrix = np.stack([self.entries[key].embedding for key in self._matrix_keys]) if self._matrix_keys else None
+        if self._matrix is None:
+            return None
+        scores = self._matrix @ vector
+        if any(entry_scope != scope for entry_scope in self._matrix_scopes):
+            scores = np.where([entry_scope == scope for entry_scope in self._matrix_scopes], scores, -np.inf)
+        best = int(np.argmax(scores))
+        return self._matrix_keys[best] if scores[best] >= self.similarity_threshold else None
+
+    async def lookup(self, question: str, scope: Optional[str] = None) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (answer or None, question embedding to pass back to ``store``)."""
+        self._check_version()
+        self._expire()
+        key = self._key(question, scope)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return self.entries[key].answer, None
+
+        vector = await self._embed(question) if self.entries else None
+        nearest = self._nearest(vector, scope) if vector is not None else None
+        if nearest is not None:
+            self.entries.move_to_end(nearest)
+            self.stats["semantic_hits"] += 1
+            return self.entries[nearest].answer, vector
+        self.stats["misses"] += 1
+        return None, vector
+
+    async def store(self, question: str, answer: str, vector: Optional[np.ndarray] = None, version: Any = _ANY,
+                    scope: Optional[str] = None) -> None:
+        """Cache ``answer``; pass the ``version`` seen at lookup so answers built on stale documents are dropped."""
+        if not answer:
+            return
+        self._check_version()
+        if version is not _ANY and version != self.version:
+            return
+        if vector is None:
+            vector = await self._embed(question)
+        self.entries[self._key(question, scope)] = CacheEntry(answer=answer, embedding=vector, created_at=time.time(),
+                                                              scope=scope)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        self._matrix = None
+
+    def describe(self) -> Dict[str, Any]:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {
+            "entries": len(self.entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **self.stats,
+        }
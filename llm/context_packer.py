@@ -0,0 +1,83 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from langchain.schema import Document
+from llm.answer_cache import normalize_question
+
+
+def estimate_text_tokens(text: str) -> int:
+    # Same 4-characters-per-token estimate as the session history trimming
+    return len(text) // 4 + 1
+
+
+class ContextPacker:
+    """Fill the QA prompt's context up to ``max_tokens`` instead of stuffing every retrieved chunk.
+
+    Documents are taken in retrieval order and duplicates (same id, or same
+    normalised text) are dropped. Tables referenced by a chunk's ``table_ids``
+    are placed right after the first chunk that references them, once; tables
+    that were not retrieved themselves are fetched with ``table_lookup``.
+    Anything that does not fit the remaining budget is skipped, and so are
+    the tables of a chunk that was skipped: nothing in the prompt cites them.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        table_lookup: Optional[Callable[[List[str]], Awaitable[List[Document]]]] = None
+    ):
+        self.max_tokens = max_tokens
+        self.table_lookup = table_lookup
+        self.stats: Dict[str, int] = {"packs": 0, "documents_in": 0, "documents_out": 0, "duplicates": 0,
+                                      "tables_fetched": 0, "over_budget": 0, "tokens_in": 0, "tokens_out": 0}
+
+    @staticmethod
+    def _key(doc: Document) -> str:
+        return doc.id or normalize_question(doc.page_content)
+
+    async def _tables(self, documents: List[Document]) -> Dict[str, Document]:
+        tables = {doc.metadata.get("table_id") or doc.id: doc
+                  for doc in documents if doc.metadata.get("type") == "table"}
+        missing = list(dict.fromkeys(table_id for doc in documents for table_id in doc.metadata.get("table_ids", [])
+                                     if table_id not in tables))
+        if missing and self.table_lookup is not None:
+            fetched = await self.table_lookup(missing)
+            self.stats["tables_fetched"] += len(fetched)
+            tables.update({doc.id: doc for doc in fetched})
+        return tables
+
+    async def pack(self, documents: List[Document]) -> List[Document]:
+        tables = await self._tables(documents)
+        packed: List[Document] = []
+        seen = set()
+        budget = self.max_tokens
+
+        def add(doc: Document) -> bool:
+            nonlocal budget
+            key = self._key(doc)
+            if key in seen:
+                self.stats["duplicates"] += 1
+                return False
+            seen.add(key)
+            tokens = estimate_text_tokens(doc.page_content)
+            if tokens > budget:
+                self.stats["over_budget"] += 1
+                return False
+            budget -= tokens
+            packed.append(doc)
+            return True
+
+        for doc in documents:
+            if not add(doc):
+                continue
+            for table_id in doc.metadata.get("table_ids", []):
+                if table_id in tables:
+                    add(tables[table_id])
+
+        self.stats["packs"] += 1
+        self.stats["documents_in"] += len(documents)
+        self.stats["documents_out"] += len(packed)
+        self.stats["tokens_in"] += sum(estimate_text_tokens(doc.page_content) for doc in documents)
+        self.stats["tokens_out"] += self.max_tokens - budget
+        return packed
+
+    def describe(self) -> Dict[str, Any]:
+        return {"max_tokens": self.max_tokens, **self.stats}
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from metrics import metrics
+import threading
+import asyncio
+
+
+class BatchingEmbeddings(Embeddings):
+    """Shared query-embedding front end: exact-text LRU cache, then micro-batching.
+
+    ``aembed_query`` calls from all sessions that miss the cache are gathered
+    for up to ``window_ms`` (or until ``max_batch`` distinct texts are waiting)
+    and sent as one ``aembed_documents`` call; each caller gets its own vector
+    back. A text already waiting or in flight is not sent again. Document
+    embedding is passed straight through. Returned vectors are shared with the
+    cache and must not be modified.
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = 5.0, max_batch: int = 64, cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._in_flight: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.stats: Dict[str, int] = {"requests": 0, "cache_hits": 0, "joined": 0, "batches": 0, "texts_sent": 0,
+                                      "full_flushes": 0, "timed_flushes": 0, "errors": 0}
+
+    # -- cache -----------------------------------------------------------
+
+    def _cached(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self.cache.get(text)
+            if vector is not None:
+                self.cache.move_to_end(text)
+            return vector
+
+    def _remember(self, text: str, vector: List[float]) -> None:
+        if not self.cache_size:
+            return
+        with self._lock:
+            self.cache[text] = vector
+            self.cache.move_to_end(text)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    # -- Embeddings interface --------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.stats["requests"] += 1
+        vector = self._cached(text)
+        if vector is not None:
+            self.stats["cache_hits"] += 1
+            return vector
+        vector = self.embeddings.embed_query(text)
+        self._remember(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.stats["requests"] += 1
+        vector = self._cached(text)
+        if vector is not None:
+            self.stats["cache_hits"] += 1
+            metrics.inc("query_embeddings_total", result="cached")
+            return vector
+        metrics.inc("query_embeddings_total", result="batched")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiting = self._pending.get(text) or self._in_flight.get(text)
+        if waiting is not None:
+            self.stats["joined"] += 1
+            waiting.append(future)
+            return await future
+        self._pending[text] = [future]
+        if len(self._pending) >= self.max_batch:
+            self.stats["full_flushes"] += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_on_timer)
+        return await future
+
+    # -- batching --------------------------------------------------------
+
+    def _flush_on_timer(self) -> None:
+        self.stats["timed_flushes"] += 1
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._in_flight.update(batch)
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+        texts = list(batch)
+        self.stats["batches"] += 1
+        self.stats["texts_sent"] += len(texts)
+        metrics.inc("query_embedding_batches_total")
+        try:
+            with metrics.timer("query_embedding_batch"):
+                vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as e:
+            self.stats["errors"] += 1
+            for text in texts:
+                self._in_flight.pop(text, None)
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for text, vector in zip(texts, vectors):
+            self._remember(text, vector)
+            self._in_flight.pop(text, None)
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(vector)
+
+    def describe(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        requests = self.stats["requests"]
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "cache_entries": len(self.cache),
+            "cache_size": self.cache_size,
+            "cache_hit_rate": self.stats["cache_hits"] / requests if requests else 0.0,
+            "avg_batch_size": self.stats["texts_sent"] / batches if batches else 0.0,
+            "avg_batch_fill": self.stats["texts_sent"] / (batches * self.max_batch) if batches else 0.0,
+            **self.stats,
+        }
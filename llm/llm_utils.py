@@ -1,9 +1,84 @@
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, AsyncIterator
+from typing import List, Optional
+import asyncio
 
-async def get_ai_response(message: str, chain, session_id: str) -> AsyncGenerator:
-  
+_END = object()
+
+
+def _answer_text(answer) -> str:
+    """Normalise the ``answer`` field of a chain chunk to a string."""
+    if isinstance(answer, dict) or hasattr(answer, "get"):
+        return answer.get("text", "")
+    if isinstance(answer, list):
+        return "\n".join([str(a) for a in answer])
+    if not isinstance(answer, str):
+        return str(answer)
+    return answer
+
+async def get_ai_deltas(message: str, chain, session_id: str, sources: Optional[List[str]] = None) -> AsyncGenerator:
+    """Yield only the new answer text of each streamed chunk; ``sources`` limits retrieval to those documents."""
+    configurable = {"session_id": session_id}
+    if sources:
+        configurable["sources"] = sources
+    async for chunk in chain.astream({"input": message}, config={"configurable": configurable}):
+        if isinstance(chunk, dict) and "answer" in chunk:
+            answer = _answer_text(chunk["answer"])
+            if answer:
+                yield answer
+
+async def get_ai_response(message: str, chain, session_id: str, sources: Optional[List[str]] = None) -> AsyncGenerator:
+    """Yield the cumulative answer so far (protocol v1)."""
     content: str = ""
-    async for chunk in chain.astream({"input": message}, config={"configurable": {"session_id": session_id}}):
-        if 'answer' in chunk and not chunk['answer'] == "":
-            content += chunk['answer']
-            yield content
\ No newline at end of file
+    async for delta in get_ai_deltas(message, chain, session_id, sources):
+        content += delta
+        yield content
+
+async def coalesce_deltas(deltas: AsyncIterator[str], interval: float = 0.03, max_bytes: int = 256) -> AsyncGenerator:
+    """Group deltas into frames, flushed every ``interval`` seconds or ``max_bytes`` bytes.
+
+    The first delta is flushed on its own so time-to-first-token is unchanged.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for delta in deltas:
+                await queue.put(delta)
+        finally:
+            await queue.put(_END)
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(pump())
+    buffer: list = []
+    size = 0
+    deadline = 0.0
+    first = True
+    try:
+        while True:
+            timeout = max(deadline - loop.time(), 0) if buffer else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield "".join(buffer)
+                buffer, size = [], 0
+                continue
+            if item is _END:
+                break
+            if first:
+                first = False
+                yield item
+                continue
+            if not buffer:
+                deadline = loop.time() + interval
+            buffer.append(item)
+            size += len(item.encode())
+            if size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+        # Surface any error raised by the upstream stream
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,216 @@
+from collections.abc import AsyncGenerator
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from llm.answer_cache import AnswerCache, normalize_question
+from llm.context_packer import ContextPacker
+from llm.session_history import get_session_history
+from retrievers import source_filter
+from metrics import metrics
+import numpy as np
+import asyncio
+import time
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # A speculative task is often discarded unawaited; fetch its exception so asyncio does not log it as lost
+    if not task.cancelled():
+        task.exception()
+
+
+class RagPipeline:
+    """History-aware RAG chain with its steps exposed.
+
+    Streams the same chunks as ``create_retrieval_chain`` wrapped in
+    ``RunnableWithMessageHistory`` (``{"context": ...}`` then ``{"answer": ...}``),
+    but computes the standalone question itself so it can be used as a cache key.
+
+    With ``speculative`` set, retrieval on the raw question starts while the
+    rewrite runs. Its results are kept when the rewritten question is close
+    enough to the raw one (``match="string"``: difflib ratio of the normalised
+    texts, ``match="embedding"``: cosine similarity); otherwise retrieval runs
+    again on the rewritten question.
+
+    A ``context_packer`` trims the retrieved chunks (and the tables they
+    reference) to its token budget before they reach the QA prompt.
+
+    A session bound to documents (``config["configurable"]["sources"]``)
+    retrieves with a ``source`` metadata filter and has its own answer cache
+    scope.
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        llm,
+        contextualize_q_prompt: ChatPromptTemplate,
+        qa_prompt: ChatPromptTemplate,
+        answer_cache: Optional[AnswerCache] = None,
+        speculative: bool = False,
+        match: str = "string",
+        match_threshold: float = 0.9,
+        embeddings=None,
+        context_packer: Optional[ContextPacker] = None
+    ):
+        if match not in ("string", "embedding"):
+            raise ValueError(f"Unknown speculation match mode: {match}")
+        self.retriever = retriever
+        self.prompts = (contextualize_q_prompt, qa_prompt)
+        self.contextualize_chain = contextualize_q_prompt | llm | StrOutputParser()
+        self.question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+        self.answer_cache = answer_cache
+        self.speculative = speculative
+        self.match = match if embeddings is not None else "string"
+        self.match_threshold = match_threshold
+        self.embeddings = embeddings
+        self.context_packer = context_packer
+        self.stats: Dict[str, float] = {"turns": 0, "scoped_turns": 0, "rewrites_skipped": 0, "speculative": 0,
+                                        "speculative_hits": 0, "speculative_misses": 0, "saved_ms": 0.0,
+                                        "wasted_ms": 0.0}
+
+    def warm_up(self) -> None:
+        """Format both prompts once so template parsing and validation are not paid by the first turn."""
+        for prompt in self.prompts:
+            prompt.format_messages(input="", chat_history=[], context="")
+
+    async def contextualize(self, message: str, chat_history: list) -> str:
+        # Same shortcut as create_history_aware_retriever: no history, no rewrite
+        if not chat_history:
+            return message
+        return await self.contextualize_chain.ainvoke({"input": message, "chat_history": chat_history})
+
+    async def _retrieve(self, query: str, config: Dict[str, Any]) -> List:
+        retrieval_filter = source_filter(config["configurable"].get("sources"))
+        if retrieval_filter is None:
+            return await self.retriever.ainvoke(query, config=config)
+        return await self.retriever.ainvoke(query, config=config, filter=retrieval_filter)
+
+    async def _timed_retrieval(self, query: str, config: Dict[str, Any]) -> Tuple[List, float]:
+        start = time.perf_counter()
+        context = await self._retrieve(query, config)
+        return context, time.perf_counter() - start
+
+    async def _embed_unit(self, text: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    async def _is_close(self, message: str, standalone: str, message_vector: Optional[asyncio.Task],
+                        standalone_vector: Optional[np.ndarray]) -> bool:
+        raw, rewritten = normalize_question(message), normalize_question(standalone)
+        if raw == rewritten:
+            return True
+        if self.match == "string":
+            return SequenceMatcher(None, raw, rewritten).ratio() >= self.match_threshold
+        if standalone_vector is None:
+            standalone_vector = await self._embed_unit(standalone)
+        return float(np.dot(await message_vector, standalone_vector)) >= self.match_threshold
+
+    async def astream(self, input: Dict[str, Any], config: Dict[str, Any]) -> AsyncGenerator:
+        message = input["input"]
+        # The SQLite history backend does blocking I/O: keep it off the event loop
+        history = await asyncio.to_thread(get_session_history, config["configurable"]["session_id"])
+        chat_history = list(await history.aget_messages())
+        sources = config["configurable"].get("sources")
+        scope = ",".join(sorted(sources)) if sources else None
+        self.stats["turns"] += 1
+        if scope is not None:
+            self.stats["scoped_turns"] += 1
+        if not chat_history:
+            self.stats["rewrites_skipped"] += 1
+
+        speculation: Optional[asyncio.Task] = None
+        message_vector: Optional[asyncio.Task] = None
+        if self.speculative and chat_history:
+            speculation = asyncio.create_task(self._timed_retrieval(message, config))
+            speculation.add_done_callback(_retrieve_exception)
+            if self.match == "embedding":
+                message_vector = asyncio.create_task(self._embed_unit(message))
+                message_vector.add_done_callback(_retrieve_exception)
+        try:
+            with metrics.timer("chat_rewrite"):
+                standalone = await self.contextualize(message, chat_history)
+
+            cached, vector, version = None, None, None
+            if self.answer_cache is not None:
+                with metrics.timer("chat_cache_lookup"):
+                    cached, vector = await self.answer_cache.lookup(standalone, scope)
+                version = self.answer_cache.version
+                metrics.inc("answer_cache_lookups_total", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                yield {"answer": cached}
+                await history.aadd_messages([HumanMessage(content=message), AIMessage(content=cached)])
+                return
+
+            with metrics.timer("chat_retrieval"):
+                if speculation is None:
+                    context = await self._retrieve(standalone, config)
+                else:
+                    context = await self._resolve_speculation(speculation, message, standalone, message_vector,
+                                                              vector, config)
+        finally:
+            for task in (speculation, message_vector):
+                if task is not None and not task.done():
+                    task.cancel()
+        metrics.inc("retrieved_chunks_total", len(context))
+        if self.context_packer is not None:
+            with metrics.timer("chat_context_pack"):
+                context = await self.context_packer.pack(context)
+        yield {"context": context}
+
+        answer = ""
+        tokens = 0
+        start = time.perf_counter()
+        with metrics.timer("chat_answer"):
+            async for token in self.question_answer_chain.astream(
+                {"input": message, "chat_history": chat_history, "context": context}, config=config
+            ):
+                if not tokens:
+                    metrics.record("chat_first_token", time.perf_counter() - start)
+                tokens += 1
+                answer += token
+                yield {"answer": token}
+        metrics.inc("answer_tokens_total", tokens)
+
+        await history.aadd_messages([HumanMessage(content=message), AIMessage(content=answer)])
+        if self.answer_cache is not None:
+            await self.answer_cache.store(standalone, answer, vector, version, scope)
+
+    async def _resolve_speculation(self, speculation: asyncio.Task, message: str, standalone: str,
+                                   message_vector: Optional[asyncio.Task], standalone_vector: Optional[np.ndarray],
+                                   config: Dict[str, Any]) -> List:
+        """Keep the speculative results if the rewrite stayed close to the raw question, else re-query."""
+        self.stats["speculative"] += 1
+        resolve_start = time.perf_counter()
+        if await self._is_close(message, standalone, message_vector, standalone_vector):
+            context, elapsed = await speculation
+            # Serially the whole retrieval would have run after the rewrite; only the remainder was waited for
+            saved = max(elapsed - (time.perf_counter() - resolve_start), 0.0)
+            self.stats["speculative_hits"] += 1
+            self.stats["saved_ms"] += saved * 1000
+            metrics.inc("speculative_retrievals_total", result="hit")
+            metrics.inc("speculative_saved_seconds_total", saved)
+            return context
+
+        self.stats["speculative_misses"] += 1
+        metrics.inc("speculative_retrievals_total", result="miss")
+        if speculation.done() and not speculation.cancelled() and speculation.exception() is None:
+            self.stats["wasted_ms"] += speculation.result()[1] * 1000
+        else:
+            speculation.cancel()
+        return await self._retrieve(standalone, config)
+
+    def describe(self) -> Dict[str, Any]:
+        speculative = self.stats["speculative"]
+        return {
+            "speculative": self.speculative,
+            "match": self.match,
+            "match_threshold": self.match_threshold,
+            "hit_rate": self.stats["speculative_hits"] / speculative if speculative else 0.0,
+            "avg_saved_ms": self.stats["saved_ms"] / self.stats["speculative_hits"] if self.stats["speculative_hits"] else 0.0,
+            **self.stats,
+            "context_packer": self.context_packer.describe() if self.context_packer is not None else None,
+        }
@@ -1,10 +1,202 @@
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+import threading
+import sqlite3
+import json
+import time
 
-store: dict = {}
+
+def estimate_tokens(message: BaseMessage) -> int:
+    # Roughly 4 characters per token for English text
+    return len(str(message.content)) // 4 + 1
+
+
+def trim_messages(messages: List[BaseMessage], max_messages: int, max_tokens: int) -> List[BaseMessage]:
+    """Keep the most recent messages that fit both caps."""
+    kept: List[BaseMessage] = []
+    tokens = 0
+    for message in reversed(messages[-max_messages:] if max_messages else messages):
+        tokens += estimate_tokens(message)
+        if max_tokens and tokens > max_tokens and kept:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+
+class BoundedChatMessageHistory(ChatMessageHistory):
+    """In-memory history that trims itself to the message and token caps on every write."""
+
+    max_messages: int = 20
+    max_tokens: int = 4000
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.messages = trim_messages(list(self.messages) + list(messages), self.max_messages, self.max_tokens)
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """History rows in a shared SQLite file so several uvicorn workers see the same sessions.
+
+    Reads and writes block (a write waits for other workers' transactions), so
+    async callers use the inherited ``aget_messages``/``aadd_messages``, which
+    run them in the default executor.
+    """
+
+    def __init__(self, store: "SessionStore", session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        rows = self.store.execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY id", (self.session_id,)
+        ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        trimmed = trim_messages(self.messages + list(messages), self.store.max_messages, self.store.max_tokens)
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+            conn.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(self.session_id, json.dumps(message_to_dict(message))) for message in trimmed]
+            )
+
+    def clear(self) -> None:
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+
+
+class SessionStore:
+    """Session histories with LRU and idle-TTL eviction, in memory or in SQLite."""
+
+    def __init__(
+        self,
+        backend: str = "memory",
+        db_path: str = "sessions.db",
+        max_sessions: int = 1000,
+        idle_ttl: float = 3600,
+        max_messages: int = 20,
+        max_tokens: int = 4000
+    ):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.sessions: "OrderedDict[str, BaseChatMessageHistory]" = OrderedDict()
+        self.last_access: Dict[str, float] = {}
+        self.evictions: Dict[str, int] = {"lru": 0, "idle": 0, "closed": 0}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if backend == "sqlite":
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, message TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id)")
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def transaction(self):
+        store = self
+
+        class _Transaction:
+            def __enter__(self):
+                store._lock.acquire()
+                store._conn.execute("BEGIN IMMEDIATE")
+                return store._conn
+
+            def __exit__(self, exc_type, exc, tb):
+                try:
+                    store._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+                finally:
+                    store._lock.release()
+
+        return _Transaction()
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            history = self.sessions.get(session_id)
+            if history is None:
+                if self.backend == "sqlite":
+                    history = SQLiteChatMessageHistory(self, session_id)
+                else:
+                    history = BoundedChatMessageHistory(max_messages=self.max_messages, max_tokens=self.max_tokens)
+                self.sessions[session_id] = history
+            self.sessions.move_to_end(session_id)
+            self.last_access[session_id] = now
+            while len(self.sessions) > self.max_sessions:
+                oldest, _ = self.sessions.popitem(last=False)
+                self._forget(oldest, "lru")
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO sessions (session_id, last_access) VALUES (?, ?)",
+                                   (session_id, now))
+        return history
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            if self.sessions.pop(session_id, None) is not None:
+                self._forget(session_id, "closed")
+
+    def _forget(self, session_id: str, reason: str) -> None:
+        self.last_access.pop(session_id, None)
+        self.evictions[reason] += 1
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _evict_idle(self, now: float) -> None:
+        # Sessions are in access order, so idle ones are at the front
+        cutoff = now - self.idle_ttl
+        while self.sessions:
+            oldest = next(iter(self.sessions))
+            if self.last_access[oldest] >= cutoff:
+                break
+            del self.sessions[oldest]
+            self._forget(oldest, "idle")
+        if self._conn is not None:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,)).fetchall()]
+            for session_id in stale:
+                self._forget(session_id, "idle")
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.backend == "sqlite":
+                messages, approx_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(message)), 0) FROM messages").fetchone()
+            else:
+                all_messages = [m for history in self.sessions.values() for m in history.messages]
+                messages = len(all_messages)
+                approx_bytes = sum(len(str(m.content)) for m in all_messages)
+            return {
+                "backend": self.backend,
+                "sessions": len(self.sessions),
+                "messages": messages,
+                "approx_bytes": approx_bytes,
+                "evictions": dict(self.evictions),
+            }
+
+
+store: Optional[SessionStore] = None
+
+def configure_store(**kwargs) -> SessionStore:
+    global store
+    store = SessionStore(**kwargs)
+    return store
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-   
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
\ No newline at end of file
+
+    if store is None:
+        configure_store()
+    return store.get(session_id)
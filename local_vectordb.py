@@ -0,0 +1,367 @@
+from langchain_openai import OpenAIEmbeddings
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from typing import List, Dict, Any, Optional, Tuple, Union
+from pathlib import Path
+from retrievers import IndexScoreRetriever, matches_filter
+from manifest import DocumentManifest
+from bulk_ingest import chunk_id
+from lexical_index import LexicalIndex
+from metrics import metrics
+import numpy as np
+import threading
+import asyncio
+import json
+import uuid
+import os
+
+
+class LocalVectorDB:
+    """Embedded vector index with the same surface as ``PineconeDB``.
+
+    Vectors are L2-normalised float32 rows in a memory-mapped file, so cosine
+    similarity is a single matrix-vector product. Texts and metadata live in a
+    JSON sidecar next to it. An optional IVF index (k-means lists, probed at
+    query time) trades exactness for speed on large corpora. Another handle's
+    writes to the same files (another worker) are picked up when the sidecar's
+    mtime changes.
+    """
+
+    def __init__(
+        self,
+        openai_api_key: Optional[str],
+        index_name: str,
+        embedding_model: str = "text-embedding-3-large",
+        data_dir: str = "vector_index",
+        embeddings: Optional[Embeddings] = None,
+        ann_min_vectors: int = 0,
+        ann_lists: int = 64,
+        ann_probes: int = 8
+    ):
+
+        self.embeddings: Embeddings = embeddings or OpenAIEmbeddings(
+            model=embedding_model,
+            openai_api_key=openai_api_key
+        )
+        self.dimension: int = 1536 if embedding_model in ["text-embedding-3-small", "text-embedding-ada-002"] else 3072
+        self.index_name = index_name
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.data_dir / f"{index_name}.f32"
+        self.sidecar_path = self.data_dir / f"{index_name}.json"
+        self.manifest = DocumentManifest(self.data_dir / f"{index_name}.manifest.json")
+        self.lexical = LexicalIndex(self.data_dir / f"{index_name}.bm25.json")
+
+        # ANN is disabled when ann_min_vectors is 0
+        self.ann_min_vectors = ann_min_vectors
+        self.ann_lists = ann_lists
+        self.ann_probes = ann_probes
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: Optional[List[np.ndarray]] = None
+        self._ann_generation = 0  # Bumped by every change to the stored vectors
+        self._ann_building = False
+
+        self._lock = threading.Lock()
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.capacity: int = 0
+        self.vectors: Optional[np.memmap] = None
+        self._mtime: Optional[float] = None
+        self._load()
+
+    # -- storage ---------------------------------------------------------
+
+    def _load(self) -> None:
+        if not self.sidecar_path.exists():
+            return
+        with open(self.sidecar_path, 'r') as f:
+            sidecar = json.load(f)
+        self.dimension = sidecar["dimension"]
+        self.capacity = sidecar["capacity"]
+        self.ids = sidecar["ids"]
+        self.texts = sidecar["texts"]
+        self.metadatas = sidecar["metadatas"]
+        if self.capacity:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                     shape=(self.capacity, self.dimension))
+        self._invalidate_ann()
+        self._mtime = self.sidecar_path.stat().st_mtime
+
+    def _refresh(self) -> None:
+        """Reload if the sidecar was rewritten through another handle; call with the lock held."""
+        try:
+            mtime = self.sidecar_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def _save(self) -> None:
+        if self.vectors is not None:
+            self.vectors.flush()
+        tmp_path = self.sidecar_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "dimension": self.dimension,
+                "capacity": self.capacity,
+                "ids": self.ids,
+                "texts": self.texts,
+                "metadatas": self.metadatas,
+            }, f)
+        os.replace(tmp_path, self.sidecar_path)
+        self._mtime = self.sidecar_path.stat().st_mtime
+
+    def _reserve(self, needed: int) -> None:
+        if needed <= self.capacity:
+            return
+        new_capacity = max(needed, self.capacity * 2, 1024)
+        old = self.vectors
+        if old is not None:
+            old.flush()
+            del old
+            self.vectors = None
+        # Growing the backing file keeps the existing rows in place
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self.capacity = new_capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.dimension))
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    # -- write path ------------------------------------------------------
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+
+        if not texts:
+            return []
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)  # Not in place: the caller's array may be float32 already
+
+        with metrics.timer("vector_upsert"), self._lock:
+            self._refresh()
+            if self.capacity == 0:
+                self.dimension = matrix.shape[1]
+            # Like a Pinecone upsert, an existing id is overwritten in place
+            row_of = {id_: row for row, id_ in enumerate(self.ids)}
+            new = []
+            for i, id_ in enumerate(ids):
+                row = row_of.get(id_)
+                if row is None:
+                    row_of[id_] = -1
+                    new.append(i)
+                elif row >= 0:
+                    self.vectors[row] = matrix[i]
+                    self.texts[row] = texts[i]
+                    self.metadatas[row] = metadatas[i]
+            start = self.count
+            self._reserve(start + len(new))
+            self.vectors[start:start + len(new)] = matrix[new]
+            self.ids.extend(ids[i] for i in new)
+            self.texts.extend(texts[i] for i in new)
+            self.metadatas.extend(metadatas[i] for i in new)
+            self._invalidate_ann()
+            self._save()
+        return ids
+
+    def add_documents(self, documents: List[Document], filename: str) -> List[str]:
+
+        # A scanned PDF without a text layer yields no chunks
+        if not documents:
+            return []
+        texts = [doc.page_content for doc in documents]
+        metadatas = [{"text": doc.page_content, "source": filename, **doc.metadata} for doc in documents]
+        ids = self.add_embeddings(texts, self.embeddings.embed_documents(texts), metadatas,
+                                  [chunk_id(filename, doc) for doc in documents])
+        self.lexical.update(added=zip(ids, texts, metadatas))
+        return ids
+
+    def delete_documents(self, ids: List[str]) -> None:
+
+        with self._lock:
+            self._refresh()
+            row_of = {id_: row for row, id_ in enumerate(self.ids)}
+            # Swap-remove from the highest row down so earlier swaps stay valid
+            for row in sorted((row_of[i] for i in ids if i in row_of), reverse=True):
+                last = self.count - 1
+                if row != last:
+                    self.vectors[row] = self.vectors[last]
+                    self.ids[row] = self.ids[last]
+                    self.texts[row] = self.texts[last]
+                    self.metadatas[row] = self.metadatas[last]
+                self.ids.pop()
+                self.texts.pop()
+                self.metadatas.pop()
+            self._invalidate_ann()
+            self._save()
+        self.lexical.update(deleted=ids)
+
+    def delete_document(self, filename: str) -> List[str]:
+        """Delete every vector of ``filename`` in one bulk call, then forget it in the manifest."""
+        document = self.manifest.document(filename)
+        if document is None:
+            return []
+        ids = [id_ for entry in document["pages"].values() for id_ in entry["ids"]]
+        with metrics.timer("vector_delete"):
+            self.delete_documents(ids)
+        self.manifest.remove(filename)
+        return ids
+
+    def is_document_processed(self, file_hash: str) -> bool:
+
+        return self.manifest.has_file(file_hash)
+
+    # -- approximate index -----------------------------------------------
+
+    def _invalidate_ann(self) -> None:
+        """Drop the IVF index after a change; call with the lock held.
+
+        Queries are exact until a background thread has clustered the new
+        vectors, so no query pays for (or waits on) the k-means.
+        """
+        self._centroids = None
+        self._lists = None
+        self._ann_generation += 1
+        if self.ann_min_vectors and self.count >= self.ann_min_vectors and not self._ann_building:
+            self._ann_building = True
+            threading.Thread(target=self._rebuild_ann, name=f"ann-{self.index_name}", daemon=True).start()
+
+    def _rebuild_ann(self) -> None:
+        while True:
+            with self._lock:
+                generation, data = self._ann_generation, self.vectors[:self.count]
+            index = self._cluster(data)
+            with self._lock:
+                # Vectors written meanwhile make this index stale: cluster again
+                if generation == self._ann_generation:
+                    self._centroids, self._lists = index
+                if generation == self._ann_generation or self.count < self.ann_min_vectors:
+                    self._ann_building = False
+                    return
+
+    def _cluster(self, data: np.ndarray, n_iter: int = 10, seed: int = 0) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Spherical k-means of ``data`` into ``ann_lists`` inverted lists."""
+        n_lists = min(self.ann_lists, len(data))
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = data[assignment == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1)
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        return centroids, [np.flatnonzero(assignment == c) for c in range(n_lists)]
+
+    def build_ann_index(self, n_iter: int = 10, seed: int = 0) -> None:
+        """Cluster the stored vectors now, instead of waiting for the background rebuild."""
+        with self._lock:
+            self._centroids, self._lists = self._cluster(self.vectors[:self.count], n_iter, seed)
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self._centroids is None:
+            return None  # ANN disabled, or its index is still being built
+        probes = np.argsort(-(self._centroids @ query))[:self.ann_probes]
+        return np.concatenate([self._lists[c] for c in probes])
+
+    # -- read path -------------------------------------------------------
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+
+        with self._lock:
+            self._refresh()
+            if not self.count:
+                return []
+            rows = self._candidate_rows(query)
+            if filter:
+                rows = np.arange(self.count) if rows is None else rows
+                rows = rows[[matches_filter(self.metadatas[r], filter) for r in rows]]
+            if rows is not None and not len(rows):
+                return []
+            # Scoring the whole index reads the memmap in place; indexing it by rows would copy it
+            scores = self.vectors[:self.count] @ query if rows is None else self.vectors[rows] @ query
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            return [
+                (Document(id=self.ids[row],
+                          page_content=self.texts[row],
+                          metadata={key: v for key, v in self.metadatas[row].items() if key != "text"}),
+                 float(scores[i]))
+                for i, row in zip(best, best if rows is None else rows[best])
+            ]
+
+    def similarity_search_with_score(
+        self,
+        query: Union[str, Document],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+
+        if isinstance(query, Document):
+            query = query.page_content
+        return self.search_by_vector(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(
+        self,
+        query: Union[str, Document],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True
+    ) -> List[Document]:
+
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    async def asimilarity_search_with_score(
+        self,
+        query: Union[str, Document],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+
+        if isinstance(query, Document):
+            query = query.page_content
+        embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self.search_by_vector, embedding, k, filter)
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+
+        with self._lock:
+            self._refresh()
+            row_of = {id_: row for row, id_ in enumerate(self.ids)}
+            return [
+                Document(id=id_,
+                         page_content=self.texts[row_of[id_]],
+                         metadata={key: v for key, v in self.metadatas[row_of[id_]].items() if key != "text"})
+                for id_ in ids if id_ in row_of
+            ]
+
+    async def aget_by_ids(self, ids: List[str]) -> List[Document]:
+
+        return await asyncio.to_thread(self.get_by_ids, ids)
+
+    def as_retriever(self, search_type: str = "similarity", search_kwargs: Optional[Dict[str, Any]] = None):
+
+        return IndexScoreRetriever(vectorstore=self,
+                                   k=(search_kwargs or {}).get("k", 4),
+                                   similarity_threshold=float("-inf"))
@@ -1,30 +1,171 @@
 from fastapi import FastAPI, File, UploadFile, APIRouter, Request, WebSocket, WebSocketDisconnect, status, BackgroundTasks, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 import uvicorn
 from app_config import APP_CONFIG
 from pathlib import Path
-from utils import PDFProcessor
-from vectordb import PineconeDB
-from fastapi.responses import JSONResponse
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from ingestion import IngestionManager
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.runnables.history import RunnableWithMessageHistory
 from connection_manager import ConnectionManager
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from llm.session_history import get_session_history
 from contextlib import asynccontextmanager
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.retrievers.document_compressors import EmbeddingsFilter
-from llm.chat import question_answer_prompt, contextualize_q_prompt
+from llm.llm_utils import get_ai_deltas, get_ai_response, coalesce_deltas
+from registry import RetrievalRegistry
+from scheduler import FairScheduler, AdmissionRejected
+from metrics import metrics
 import asyncio
+import hashlib
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+# langchain, OpenAI, Pinecone and the PDF libraries load during the warm-up after startup, not on import
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+    from langchain.prompts import ChatPromptTemplate
+    from langchain_core.retrievers import BaseRetriever
+    from llm.answer_cache import AnswerCache
+    from llm.context_packer import ContextPacker
+    from llm.rag_pipeline import RagPipeline
 
 
-app = FastAPI(debug = True)
 docs_dir = 'documents/'
 
+manager = ConnectionManager(max_queue=APP_CONFIG['ws_send_queue_size'],
+                            policy=APP_CONFIG['ws_slow_consumer_policy'],
+                            send_timeout=APP_CONFIG['ws_send_timeout'])
+scheduler = FairScheduler(max_concurrent=APP_CONFIG['llm_max_concurrency'],
+                          max_queue=APP_CONFIG['llm_max_queue'],
+                          queue_timeout=APP_CONFIG['llm_queue_timeout'])
+ingestion = IngestionManager(batch_pages=APP_CONFIG['ingest_batch_pages'],
+                             workers=APP_CONFIG['pdf_workers'],
+                             chunk_tokens=APP_CONFIG['pdf_chunk_tokens'],
+                             strict_tables=APP_CONFIG['pdf_strict_tables'],
+                             scheduler=scheduler,
+                             batch_tokens=APP_CONFIG['ingest_batch_tokens'],
+                             batch_size=APP_CONFIG['ingest_batch_size'],
+                             in_flight=APP_CONFIG['ingest_in_flight'],
+                             max_retries=APP_CONFIG['ingest_max_retries'])
+def chain_factory(retriever, llm, answer_cache, embeddings, context_packer) -> "RagPipeline":
+    from llm.chat import question_answer_prompt, contextualize_q_prompt
+
+    return bot_creation(retriever, llm, contextualize_q_prompt, question_answer_prompt, answer_cache, embeddings,
+                        context_packer)
+
+
+registry = RetrievalRegistry(APP_CONFIG, chain_factory=chain_factory, index_name=APP_CONFIG['index_name'])
+
+
+class WarmUp:
+    """Background start-up work; ``/ready`` reports it and new chat sessions wait for its first attempt.
+
+    A failed attempt (e.g. Pinecone unreachable at boot) is retried with
+    exponential backoff until one succeeds, so the worker becomes ready once
+    the outage is over instead of staying out of rotation.
+    """
+
+    def __init__(self, backoff: float = 1.0, max_backoff: float = 30.0):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.done = asyncio.Event()
+        self.ready = False
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+
+    def start(self) -> asyncio.Task:
+        # A fresh event per server start, bound to that server's loop
+        self.done = asyncio.Event()
+        self.ready = False
+        self.attempts = 0
+        self.error = None
+        return asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        start = time.perf_counter()
+        while True:
+            self.attempts += 1
+            try:
+                await asyncio.to_thread(registry.warm_up)
+                await asyncio.to_thread(ingestion.warm_up)
+            except Exception as e:
+                self.error = str(e)
+                print(f"Warm-up attempt {self.attempts} failed: {e}")
+                # Sessions opened meanwhile stop waiting and try to build the chain themselves
+                self.done.set()
+                await asyncio.sleep(min(self.max_backoff, self.backoff * 2 ** (self.attempts - 1)))
+                continue
+            self.error = None
+            self.ready = True
+            self.seconds = time.perf_counter() - start
+            metrics.record("startup_warmup", self.seconds)
+            self.done.set()
+            return
+
+    def describe(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "warming_up": not self.ready, "attempts": self.attempts, "error": self.error,
+                "warmup_seconds": self.seconds}
+
+
+warmup = WarmUp()
+
+
+class IndexPage:
+    """``index.html`` held in memory, re-read when the file changes, served with an ETag."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.mtime: Optional[float] = None
+        self.body = b""
+        self.etag = ""
+
+    def get(self):
+        mtime = self.path.stat().st_mtime
+        if mtime != self.mtime:
+            self.body = self.path.read_bytes()
+            self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+            self.mtime = mtime
+        return self.body, self.etag
+
+
+index_page = IndexPage(Path(__file__).parent / 'index.html')
+
+
+def session_store():
+    from llm import session_history
+
+    return session_history.store
+
+
+metrics.enabled = APP_CONFIG['metrics_enabled']
+metrics.gauge("active_connections", lambda: len(manager.active_connections), "Open chat WebSockets")
+metrics.gauge("session_store_sessions", lambda: len(session_store().sessions), "Chat histories held by this worker")
+metrics.gauge("scheduler_active", lambda: scheduler.active, "Chat turns and embedding batches holding a slot")
+metrics.gauge("scheduler_queued", lambda: scheduler.queued, "Requests waiting for a slot")
+metrics.gauge("ready", lambda: float(warmup.ready), "1 once the start-up warm-up has finished")
+metrics.gauge("answer_cache_entries", lambda: len(registry.answer_cache.entries), "Cached answers")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from llm.session_history import configure_store
+
+    configure_store(backend=APP_CONFIG['session_backend'],
+                    db_path=APP_CONFIG['session_db_path'],
+                    max_sessions=APP_CONFIG['session_max'],
+                    idle_ttl=APP_CONFIG['session_idle_ttl'],
+                    max_messages=APP_CONFIG['session_max_messages'],
+                    max_tokens=APP_CONFIG['session_max_tokens'])
+    # Serve right away; the retrieval stack and index handles are built in the background
+    warmup_task = warmup.start()
+    yield
+    # A warm-up still retrying would otherwise hold up shutdown
+    warmup_task.cancel()
+    ingestion.close()
+    await registry.aclose()
+
+
+app = FastAPI(debug = True, lifespan=lifespan)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,47 +175,63 @@ app.add_middleware(
     allow_headers=["*"],   
 )
 
-manager = ConnectionManager()
-
-def bot_creation(retriever: ContextualCompressionRetriever, 
-                 llm: ChatOpenAI, 
-                 contextualize_q_prompt: ChatPromptTemplate, 
-                 qa_prompt: ChatPromptTemplate
-                 ) -> RunnableWithMessageHistory:
-   
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-    return RunnableWithMessageHistory(
-        rag_chain,
-        get_session_history,
-        input_messages_key="input",
-        history_messages_key="chat_history",
-        output_messages_key="answer",
-    )
-
-async def get_ai_response(message: str, chain, session_id: str):
+def bot_creation(retriever: "BaseRetriever", 
+                 llm: "ChatOpenAI", 
+                 contextualize_q_prompt: "ChatPromptTemplate", 
+                 qa_prompt: "ChatPromptTemplate",
+                 answer_cache: Optional["AnswerCache"] = None,
+                 embeddings: Optional["OpenAIEmbeddings"] = None,
+                 context_packer: Optional["ContextPacker"] = None
+                 ) -> "RagPipeline":
+    from llm.rag_pipeline import RagPipeline
    
-    content: str = ""
-    # print("Entered get_ai_response")
+    return RagPipeline(retriever, llm, contextualize_q_prompt, qa_prompt, answer_cache,
+                       speculative=APP_CONFIG['speculative_retrieval'],
+                       match=APP_CONFIG['speculation_match'],
+                       match_threshold=APP_CONFIG['speculation_threshold'],
+                       embeddings=embeddings,
+                       context_packer=context_packer)
 
-    async for chunk in chain.astream({"input": message}, config={"configurable": {"session_id": session_id}}):
-        # print("Raw chunk received:", chunk)  
+async def send_answer(unique_id: str, message: str, chain, session_id: str, protocol: str, timing: bool = False,
+                      sources: Optional[List[str]] = None):
+    """Stream one answer and ``done``; with ``timing`` set, a per-stage breakdown (ms) follows."""
+    with metrics.turn(timing) as timings:
+        await stream_answer(unique_id, message, chain, session_id, protocol, sources)
+    await manager.send_json(unique_id, {"type": "done", "content": ""})
+    if timings is not None:
+        await manager.send_json(unique_id, {"type": "timing", "stages": timings})
 
-        if isinstance(chunk, dict) and "answer" in chunk:
-            answer = chunk["answer"]
+async def stream_answer(unique_id: str, message: str, chain, session_id: str, protocol: str,
+                        sources: Optional[List[str]] = None):
+    """Cumulative ``stream`` frames (v1) or coalesced ``delta`` frames (v2)."""
+    if protocol == "2":
+        seq = 0
+        deltas = get_ai_deltas(message, chain, session_id, sources)
+        async for delta in coalesce_deltas(deltas,
+                                           interval=APP_CONFIG['stream_coalesce_ms'] / 1000,
+                                           max_bytes=APP_CONFIG['stream_coalesce_bytes']):
+            await manager.send_json(unique_id, {"type": "delta", "seq": seq, "content": delta})
+            seq += 1
+    else:
+        async for text in get_ai_response(message, chain, session_id, sources):
+            await manager.send_json(unique_id, {
+                "type": "stream",
+                "content": text
+            })
 
-            
-            if isinstance(answer, dict) or hasattr(answer, "get"):
-                answer = answer.get("text", "")  
-            elif isinstance(answer, list):  
-                answer = "\n".join([str(a) for a in answer])  
-            elif not isinstance(answer, str):
-                answer = str(answer)  
+def queue_notifier(unique_id: str):
+    """Tell a waiting client its place in the admission queue."""
+    async def notify(position: int):
+        await manager.send_json(unique_id, {"type": "queue", "position": position})
+    return notify
 
-            if answer.strip():  
-                content += answer
-                yield content
+async def send_text(unique_id: str, text: str, protocol: str):
+    """Send a complete server message in the client's protocol."""
+    if protocol == "2":
+        await manager.send_json(unique_id, {"type": "delta", "seq": 0, "content": text})
+    else:
+        await manager.send_json(unique_id, {"type": "stream", "content": text})
+    await manager.send_json(unique_id, {"type": "done", "content": ""})
 
 
 @asynccontextmanager
@@ -86,20 +243,57 @@ async def manage_connection(websocket: WebSocket, client_id: str):
         session_id, unique_id = await manager.connect(client_id, websocket)
         yield session_id, unique_id
     finally:
-        if unique_id:
-            await manager.disconnect(unique_id)
+        try:
+            if session_id:
+                # Session ids are minted per connection, so the history cannot be resumed. The thread
+                # finishes the drop even if this task is cancelled while waiting for it
+                await asyncio.to_thread(session_store().drop, session_id)
+        finally:
+            if unique_id:
+                await manager.disconnect(unique_id)
 
 
 @app.get("/", response_class=HTMLResponse)
-async def home():
-   
-    current_dir = Path(__file__).parent
-    with open(current_dir / 'index.html', 'r') as f:
-        html_context = f.read()
-    return html_context
+async def home(request: Request) -> Response:
+
+    body, etag = index_page.get()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=body, headers=headers)
+
+@app.get("/ready")
+async def readiness() -> JSONResponse:
+
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.describe())
+
+@app.get("/registry")
+async def registry_stats() -> JSONResponse:
+
+    return JSONResponse(status_code=200, content=registry.describe())
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/connections")
+async def connection_stats() -> JSONResponse:
+
+    return JSONResponse(status_code=200, content=manager.describe())
+
+@app.get("/scheduler")
+async def scheduler_stats() -> JSONResponse:
+
+    return JSONResponse(status_code=200, content=scheduler.describe())
+
+@app.get("/sessions")
+async def session_stats() -> JSONResponse:
+
+    return JSONResponse(status_code=200, content=await asyncio.to_thread(session_store().describe))
 
 @app.post("/upload_pdf")
-def upload_pdf_file(file: UploadFile = File(...)) -> JSONResponse:
+async def upload_pdf_file(file: UploadFile = File(...)) -> JSONResponse:
     
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
@@ -108,33 +302,34 @@ def upload_pdf_file(file: UploadFile = File(...)) -> JSONResponse:
         
         file_path = f"{docs_dir}/{file.filename}"
         # Upload extracted text chunks to Pinecone
-        pc = PineconeDB(pinecone_api_key=APP_CONFIG.get('pinecone_key'),
-                        openai_api_key=APP_CONFIG.get('openai_key'), 
-                        index_name="project-j-index")
-        
-        if pc.is_document_processed(pc):
+        pc = await asyncio.to_thread(registry.get_document_db)
+
+        # Stream the uploaded PDF to disk without holding it in memory, hashing as we go
+        file_hash = hashlib.sha256()
+        with open(f"{file_path}.part", 'wb') as f:
+            while chunk := await file.read(APP_CONFIG['upload_chunk_bytes']):
+                file_hash.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        await file.close()
+        file_hash = file_hash.hexdigest()
+
+        if await asyncio.to_thread(pc.is_document_processed, file_hash):
+            os.remove(f"{file_path}.part")
             return JSONResponse(
                 status_code=200,
                 content={"message": "PDF already processed. Skipping re-chunking."}
             )
-        # Save the uploaded PDF
-        with open(file_path, 'wb') as f:
-            f.write(file.file.read())
-        file.file.close()
+        os.replace(f"{file_path}.part", file_path)
 
-        # Process the PDF
-        pdf_processor = PDFProcessor(file_path)
-        documents = pdf_processor.process()
-
-        
-        document_ids = pc.add_documents(documents,  file.filename)
+        # Extract, embed and upsert in the background
+        job = ingestion.create_job(file.filename, file_path, file_hash)
+        ingestion.start(job, pc)
 
         return JSONResponse(
-            status_code=200,
+            status_code=202,
             content={
-                "message": "PDF processed and uploaded successfully.",
-                "total_chunks": len(documents),
-                "uploaded_document_ids": document_ids
+                "message": "PDF received. Processing started.",
+                "job_id": job.job_id
             }
         )
 
@@ -143,51 +338,71 @@ def upload_pdf_file(file: UploadFile = File(...)) -> JSONResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str) -> JSONResponse:
+
+    job = ingestion.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return JSONResponse(status_code=200, content=job.progress())
+
+
+@app.get("/documents")
+async def list_documents() -> JSONResponse:
+
+    manifest = await asyncio.to_thread(registry.get_manifest)
+    documents = await asyncio.to_thread(manifest.summary)
+    return JSONResponse(status_code=200, content={
+        "index_name": APP_CONFIG['index_name'],
+        "vectors": sum(document["vectors"] for document in documents),
+        "documents": documents,
+    })
+
+
+@app.delete("/documents/{filename}")
+async def delete_document(filename: str) -> JSONResponse:
+
+    pc = await asyncio.to_thread(registry.get_document_db)
+    if await asyncio.to_thread(pc.manifest.document, filename) is None:
+        raise HTTPException(status_code=404, detail="Unknown document.")
+    ids = await asyncio.to_thread(pc.delete_document, filename)
+    return JSONResponse(status_code=200, content={"message": f"Deleted {filename}.", "vectors_deleted": len(ids)})
+
+
 @app.websocket("/chat/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
    
-    index_name = "project-j-index"
-    pinecone_vectordb = PineconeVectorStore(index_name=index_name, 
-                                            embedding=OpenAIEmbeddings(model="text-embedding-3-large"), 
-                                            pinecone_api_key=APP_CONFIG['pinecone_key'])
-    llm_bot = ChatOpenAI(model=APP_CONFIG['llm_model'],
-                     temperature=APP_CONFIG['llm_temperature'], 
-                     api_key=APP_CONFIG['openai_key'])
     async with manage_connection(websocket, client_id) as (session_id, unique_id):
         try:
-            base_retriever = pinecone_vectordb.as_retriever(search_type="similarity",
-                                                       search_kwargs={
-                                                           "k": 20,
-                                                       })
-            embeddings_filter = EmbeddingsFilter(embeddings=OpenAIEmbeddings(model="text-embedding-3-large"), similarity_threshold=0.2)
-            retriever = ContextualCompressionRetriever(
-                base_compressor=embeddings_filter,
-                base_retriever=base_retriever,
-            )
-            conversational_rag_chain = bot_creation(retriever, llm_bot, contextualize_q_prompt, question_answer_prompt)
-            await manager.send_json(unique_id, {
-                "type": "stream",
-                "content": "Hello! I'm here to help with the PDF that you have uploaded. Please ask any question you may have."
-            })
-            await manager.send_json(unique_id, {"type": "done", "content": ""})
+            # A session opened during start-up waits for the warm-up instead of building the stack itself
+            await warmup.done.wait()
+            conversational_rag_chain = await asyncio.to_thread(registry.get_chain)
+            # v1 (default) re-sends the cumulative answer, v2 sends sequenced deltas
+            protocol = websocket.query_params.get("protocol", "1")
+            timing = APP_CONFIG['ws_timing'] or websocket.query_params.get("timing") == "1"
+            # ?documents=a.pdf,b.pdf binds the session to those documents; by default every document is searched
+            sources = [name.strip() for name in websocket.query_params.get("documents", "").split(",") if name.strip()]
+            await send_text(unique_id,
+                            "Hello! I'm here to help with the PDF that you have uploaded. Please ask any question you may have.",
+                            protocol)
             while True:
                 try:
                     message = await asyncio.wait_for(
                         websocket.receive_text(), 
                         timeout=3600
                     )
-                    async for text in get_ai_response(message, conversational_rag_chain, session_id):
-                        await manager.send_json(unique_id, {
-                            "type": "stream",
-                            "content": text
-                        })
-                    await manager.send_json(unique_id, {"type": "done", "content": ""})
+                    try:
+                        async with scheduler.slot(client_id, on_position=queue_notifier(unique_id)):
+                            await send_answer(unique_id, message, conversational_rag_chain, session_id, protocol, timing,
+                                              sources)
+                    except AdmissionRejected:
+                        await send_text(unique_id,
+                                        "The server is busy right now. Please try again in a moment.",
+                                        protocol)
                 except asyncio.TimeoutError:
-                    await manager.send_json(unique_id, {
-                        "type": "stream",
-                        "content": "I'm sorry, I didn't receive a message for a while. Please try again."
-                    })
-                    await manager.send_json(unique_id, {"type": "done", "content": ""})
+                    await send_text(unique_id,
+                                    "I'm sorry, I didn't receive a message for a while. Please try again.",
+                                    protocol)
                     await manager.disconnect(unique_id, reason="Connection timeout")
 
         except WebSocketDisconnect as e:
@@ -0,0 +1,131 @@
+from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+import fcntl
+import json
+import os
+
+
+class DocumentManifest:
+    """Per-document content hashes and vector ids, persisted next to the index.
+
+    Layout::
+
+        {"version": 3,
+         "by_hash": {"<file sha256>": "<filename>"},
+         "documents": {"<filename>": {"sha256": "...",
+                                      "pages": {"1": {"sha256": "...", "ids": [...]}}}}}
+
+    Reads pick up other workers' writes when the file's mtime changes; writes
+    reload it under an exclusive lock on a sibling ``.lock`` file first, so
+    concurrent uploads from several workers do not overwrite each other.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_suffix(".lock")
+        self._lock = threading.Lock()
+        self.version: int = 0
+        self.by_hash: Dict[str, str] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._mtime: Optional[float] = None
+        self.reload()
+
+    def reload(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        self.version = data.get("version", 0)
+        self.by_hash = data.get("by_hash", {})
+        self.documents = data.get("documents", {})
+        self._mtime = self.path.stat().st_mtime
+
+    def current_version(self) -> int:
+        """Version of the manifest on disk, picking up writes from other processes."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return self.version
+        if mtime != self._mtime:
+            self.reload()
+        return self.version
+
+    @contextmanager
+    def _locked(self):
+        """Hold the manifest for a read-modify-write, against this process's threads and other workers."""
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+            self.reload()
+            yield
+
+    def _save(self, filename: str) -> None:
+        """Persist the change just made to ``filename`` (the file backend rewrites the whole manifest)."""
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": self.version, "by_hash": self.by_hash, "documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    def has_file(self, file_hash: str) -> bool:
+        self.current_version()
+        return file_hash in self.by_hash
+
+    def document(self, filename: str) -> Optional[Dict[str, Any]]:
+        self.current_version()
+        return self.documents.get(filename)
+
+    def page_hashes(self, filename: str) -> Dict[int, str]:
+        self.current_version()
+        document = self.documents.get(filename) or {"pages": {}}
+        return {int(page): entry["sha256"] for page, entry in document["pages"].items()}
+
+    def page_ids(self, filename: str, pages: List[int]) -> List[str]:
+        self.current_version()
+        document = self.documents.get(filename) or {"pages": {}}
+        return [id_ for page in pages for id_ in document["pages"].get(str(page), {}).get("ids", [])]
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One entry per document: pages and vector count, which is also what a source filter searches."""
+        self.current_version()
+        return [
+            {"filename": filename,
+             "sha256": document["sha256"],
+             "pages": len(document["pages"]),
+             "vectors": sum(len(entry["ids"]) for entry in document["pages"].values())}
+            for filename, document in sorted(self.documents.items())
+        ]
+
+    def record(self, filename: str, file_hash: str, page_hashes: Dict[int, str], page_ids: Dict[int, List[str]]) -> None:
+        """Store the new state of ``filename``; pages absent from ``page_ids`` keep their old ids."""
+        with self._locked():
+            previous = self.documents.get(filename)
+            if previous is not None:
+                self.by_hash.pop(previous["sha256"], None)
+                old_pages = previous["pages"]
+            else:
+                old_pages = {}
+            pages = {}
+            for page, page_hash in page_hashes.items():
+                if page in page_ids:
+                    ids = page_ids[page]
+                else:
+                    ids = old_pages.get(str(page), {}).get("ids", [])
+                pages[str(page)] = {"sha256": page_hash, "ids": ids}
+            self.documents[filename] = {"sha256": file_hash, "pages": pages}
+            self.by_hash[file_hash] = filename
+            self.version += 1
+            self._save(filename)
+
+    def remove(self, filename: str) -> List[str]:
+        """Forget ``filename`` and return the vector ids that belonged to it."""
+        with self._locked():
+            document = self.documents.pop(filename, None)
+            if document is None:
+                return []
+            self.by_hash.pop(document["sha256"], None)
+            self.version += 1
+            self._save(filename)
+            return [id_ for entry in document["pages"].values() for id_ in entry["ids"]]
@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds, roughly the Prometheus client defaults extended for LLM calls
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage durations (ms) of the chat turn running in the current task, when a breakdown was requested
+_current_turn: ContextVar[Optional[Dict[str, float]]] = ContextVar("current_turn", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+class Metrics:
+    """Minimal in-process metrics registry rendered in the Prometheus text format.
+
+    When disabled, ``timer`` returns a shared no-op context manager unless the
+    current chat turn asked for a timing breakdown, so the hot path pays one
+    attribute check and one context-variable lookup.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "rag"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.help: Dict[str, str] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, fn: Callable[[], float], help: str = "") -> None:
+        self.gauges[name] = fn
+        if help:
+            self.help[name] = help
+
+    def timer(self, stage: str):
+        turn = _current_turn.get()
+        if not self.enabled and turn is None:
+            return _NOOP
+        return self._timed(stage, turn)
+
+    def record(self, stage: str, seconds: float) -> None:
+        """Record a stage duration measured by the caller."""
+        turn = _current_turn.get()
+        if not self.enabled and turn is None:
+            return
+        self._record(stage, seconds, turn)
+
+    def _record(self, stage: str, seconds: float, turn: Optional[Dict[str, float]]) -> None:
+        self.observe("stage_seconds", seconds, stage=stage)
+        if turn is not None:
+            turn[stage] = turn.get(stage, 0.0) + seconds * 1000
+
+    @contextmanager
+    def _timed(self, stage: str, turn: Optional[Dict[str, float]]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(stage, time.perf_counter() - start, turn)
+
+    @contextmanager
+    def turn(self, breakdown: bool):
+        """Collect the stage timings of one chat turn when ``breakdown`` is set; yields the dict or None."""
+        timings: Optional[Dict[str, float]] = {} if breakdown else None
+        token = _current_turn.set(timings)
+        start = time.perf_counter()
+        try:
+            yield timings
+        finally:
+            _current_turn.reset(token)
+            elapsed = time.perf_counter() - start
+            self.observe("turn_seconds", elapsed)
+            if timings is not None:
+                timings["total"] = elapsed * 1000
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+
+        def fmt_labels(labels: Tuple, extra: Tuple = ()) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        seen = set()
+        for (name, labels), histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{fmt_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_bucket{fmt_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{metric}_sum{fmt_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{fmt_labels(labels)} {histogram.count}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{fmt_labels(labels)} {value}")
+
+        for name, fn in sorted(self.gauges.items()):
+            metric = f"{self.prefix}_{name}"
+            if name in self.help:
+                lines.append(f"# HELP {metric} {self.help[name]}")
+            lines.append(f"# TYPE {metric} gauge")
+            try:
+                lines.append(f"{metric} {float(fn())}")
+            except Exception:
+                continue  # A gauge whose source is not ready yet is skipped
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,255 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+from manifest import DocumentManifest
+import threading
+import time
+
+# The langchain, OpenAI and Pinecone clients are imported when the registry is built,
+# so importing the app stays cheap and the cost moves into the warm-up
+if TYPE_CHECKING:
+    import httpx
+    from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+    from langchain_pinecone import PineconeVectorStore
+    from langchain_core.retrievers import BaseRetriever
+    from local_vectordb import LocalVectorDB
+    from lexical_index import LexicalIndex
+    from vectordb import PineconeDB
+    from llm.answer_cache import AnswerCache
+    from llm.context_packer import ContextPacker
+    from llm.embedding_batcher import BatchingEmbeddings
+    from llm.rag_pipeline import RagPipeline
+
+
+def create_embeddings(**kwargs) -> "OpenAIEmbeddings":
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(**kwargs)
+
+
+def create_llm(**kwargs) -> "ChatOpenAI":
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(**kwargs)
+
+
+@dataclass
+class RegistryStats:
+    builds: int = 0
+    chain_checkouts: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "builds": self.builds,
+            "chain_checkouts": self.chain_checkouts,
+            "reuse_count": max(self.chain_checkouts - self.builds, 0),
+        }
+
+
+class RetrievalRegistry:
+    """Process-wide retrieval stack, built once per worker and shared by all sessions.
+
+    Only the session history differs between connections; the vector store, the
+    embedding/LLM clients and their pooled HTTP connections are reused.
+    ``warm_up`` builds all of it ahead of the first request, together with the
+    vector store that uploads and deletes go through.
+    """
+
+    def __init__(self, config: Dict[str, Any], chain_factory, index_name: str = "project-j-index"):
+        self.config = config
+        self.chain_factory = chain_factory
+        self.index_name = index_name
+        self.stats = RegistryStats()
+        self.http_client: Optional[httpx.Client] = None
+        self.http_async_client: Optional[httpx.AsyncClient] = None
+        self.embeddings: Optional[Union[OpenAIEmbeddings, BatchingEmbeddings]] = None
+        self.llm: Optional[ChatOpenAI] = None
+        self.vectorstore: Optional[Union[PineconeVectorStore, LocalVectorDB]] = None
+        self.lexical: Optional[LexicalIndex] = None
+        self.retriever: Optional[BaseRetriever] = None
+        self.answer_cache: Optional[AnswerCache] = None
+        self.chain: Optional[RagPipeline] = None
+        self.document_db: Optional[Union[PineconeDB, LocalVectorDB]] = None
+        self.warmup_seconds: Optional[float] = None
+        self._lock = threading.RLock()
+
+    def _limits(self) -> "httpx.Limits":
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.config.get('http_pool_size', 20),
+            max_keepalive_connections=self.config.get('http_pool_keepalive', 10),
+        )
+
+    def _build_retriever(self) -> "BaseRetriever":
+        from langchain.retrievers import ContextualCompressionRetriever
+        from retrievers import BM25Retriever, HybridRetriever, IndexScoreRetriever, TimedEmbeddingsFilter
+        from lexical_index import LexicalIndex
+        from vectordb import lexical_index_path
+
+        k = self.config.get('retriever_k', 20)
+        threshold = self.config.get('similarity_threshold', 0.2)
+        mode = self.config.get('retriever_mode', 'index_scores')
+        if mode in ('bm25', 'hybrid'):
+            self.lexical = LexicalIndex(lexical_index_path(self.config, self.index_name))
+            lexical = BM25Retriever(index=self.lexical, k=k)
+            if mode == 'bm25':
+                return lexical
+            return HybridRetriever(lexical=lexical,
+                                   dense=IndexScoreRetriever(vectorstore=self.vectorstore, k=k,
+                                                             similarity_threshold=threshold),
+                                   k=k,
+                                   rrf_k=self.config.get('rrf_k', 60),
+                                   shortcut_confidence=self.config.get('lexical_shortcut_confidence', 0.0))
+        if mode == 'index_scores':
+            return IndexScoreRetriever(vectorstore=self.vectorstore, k=k, similarity_threshold=threshold)
+
+        base_retriever = self.vectorstore.as_retriever(search_type="similarity",
+                                                       search_kwargs={"k": k})
+        embeddings_filter = TimedEmbeddingsFilter(embeddings=self.embeddings, similarity_threshold=threshold)
+        return ContextualCompressionRetriever(
+            base_compressor=embeddings_filter,
+            base_retriever=base_retriever,
+        )
+
+    def _build_answer_cache(self) -> Optional["AnswerCache"]:
+        from llm.answer_cache import AnswerCache
+
+        if not self.config.get('answer_cache_enabled', True):
+            return None
+        return AnswerCache(embeddings=self.embeddings,
+                           version_fn=self.get_manifest().current_version,
+                           similarity_threshold=self.config.get('answer_cache_threshold', 0.95),
+                           max_entries=self.config.get('answer_cache_size', 512),
+                           ttl=self.config.get('answer_cache_ttl', 3600))
+
+    def _table_lookup(self):
+        from functools import partial
+        from local_vectordb import LocalVectorDB
+        from vectordb import afetch_documents
+
+        if isinstance(self.vectorstore, LocalVectorDB):
+            return self.vectorstore.aget_by_ids
+        # PineconeVectorStore inherits aget_by_ids from VectorStore, which raises NotImplementedError
+        return partial(afetch_documents, self.vectorstore.index)
+
+    def _build_context_packer(self) -> Optional["ContextPacker"]:
+        from llm.context_packer import ContextPacker
+
+        max_tokens = self.config.get('context_max_tokens', 3000)
+        if not max_tokens:
+            return None
+        return ContextPacker(max_tokens=max_tokens, table_lookup=self._table_lookup())
+
+    def get_manifest(self) -> DocumentManifest:
+        """The document manifest: a file next to the local index, or records inside the Pinecone index."""
+        if self.config.get('vector_backend', 'pinecone') == 'local':
+            from vectordb import manifest_path
+
+            return DocumentManifest(manifest_path(self.config, self.index_name))
+        return self.get_document_db().manifest
+
+    def build(self) -> None:
+        # The warm-up thread and a first request may race to build
+        with self._lock:
+            if self.chain is None:
+                self._build()
+
+    def _build(self) -> None:
+        import httpx
+        from langchain_pinecone import PineconeVectorStore
+        from local_vectordb import LocalVectorDB
+        from llm.embedding_batcher import BatchingEmbeddings
+
+        timeout = httpx.Timeout(self.config.get('http_timeout', 60.0))
+        self.http_client = httpx.Client(limits=self._limits(), timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=timeout)
+
+        self.embeddings = create_embeddings(model="text-embedding-3-large",
+                                           api_key=self.config['openai_key'],
+                                           http_client=self.http_client,
+                                           http_async_client=self.http_async_client)
+        if self.config.get('embed_batching_enabled', True):
+            # Query embeddings from every session share one cache and batched upstream calls
+            self.embeddings = BatchingEmbeddings(self.embeddings,
+                                                 window_ms=self.config.get('embed_batch_window_ms', 5),
+                                                 max_batch=self.config.get('embed_batch_max', 64),
+                                                 cache_size=self.config.get('embed_cache_size', 1024))
+        self.llm = create_llm(model=self.config['llm_model'],
+                              temperature=self.config['llm_temperature'],
+                              api_key=self.config['openai_key'],
+                              http_client=self.http_client,
+                              http_async_client=self.http_async_client)
+        if self.config.get('vector_backend', 'pinecone') == 'local':
+            self.vectorstore = LocalVectorDB(openai_api_key=self.config['openai_key'],
+                                             index_name=self.index_name,
+                                             data_dir=self.config.get('local_index_dir', 'vector_index'),
+                                             embeddings=self.embeddings,
+                                             ann_min_vectors=self.config.get('local_ann_min_vectors', 0))
+        else:
+            self.vectorstore = PineconeVectorStore(index_name=self.index_name,
+                                                   embedding=self.embeddings,
+                                                   pinecone_api_key=self.config['pinecone_key'])
+
+        self.retriever = self._build_retriever()
+        self.answer_cache = self._build_answer_cache()
+        self.chain = self.chain_factory(self.retriever, self.llm, self.answer_cache, self.embeddings,
+                                        self._build_context_packer())
+        self.stats.builds += 1
+
+    def get_chain(self) -> "RagPipeline":
+        if self.chain is None:
+            self.build()
+        self.stats.chain_checkouts += 1
+        return self.chain
+
+    def get_document_db(self) -> Union["PineconeDB", "LocalVectorDB"]:
+        """Vector store used by uploads and deletes, created once instead of per request.
+
+        On the local backend this is the store chat reads from, so its writes are seen by the next turn.
+        """
+        with self._lock:
+            if self.document_db is None:
+                from vectordb import create_vectordb
+
+                if self.config.get('vector_backend', 'pinecone') == 'local':
+                    self.build()
+                    self.document_db = self.vectorstore
+                else:
+                    self.document_db = create_vectordb(self.config, index_name=self.index_name)
+            return self.document_db
+
+    def warm_up(self) -> None:
+        """Build the chat chain, resolve the index handles and format the prompts once."""
+        start = time.perf_counter()
+        self.build()
+        self.chain.warm_up()
+        self.get_document_db()
+        self.warmup_seconds = time.perf_counter() - start
+
+    async def aclose(self) -> None:
+        if self.http_async_client is not None:
+            await self.http_async_client.aclose()
+        if self.http_client is not None:
+            self.http_client.close()
+        self.chain = None
+
+    def describe(self) -> Dict[str, Any]:
+        built = self.chain is not None
+        if built:
+            from retrievers import HybridRetriever
+            from llm.embedding_batcher import BatchingEmbeddings
+        return {
+            "built": built,
+            "index_name": self.index_name,
+            "vector_backend": self.config.get('vector_backend', 'pinecone'),
+            "retriever_mode": self.config.get('retriever_mode', 'index_scores'),
+            "pool_size": self.config.get('http_pool_size', 20),
+            "pool_keepalive": self.config.get('http_pool_keepalive', 10),
+            **self.stats.as_dict(),
+            "answer_cache": self.answer_cache.describe() if self.answer_cache is not None else None,
+            "pipeline": self.chain.describe() if self.chain is not None else None,
+            "lexical_index": self.lexical.describe() if self.lexical is not None else None,
+            "hybrid": self.retriever.stats if built and isinstance(self.retriever, HybridRetriever) else None,
+            "query_embeddings": self.embeddings.describe() if built and isinstance(self.embeddings, BatchingEmbeddings) else None,
+            "warmup_seconds": self.warmup_seconds,
+        }
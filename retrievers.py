@@ -0,0 +1,161 @@
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import Field
+from langchain.schema import Document
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.retrievers.document_compressors import EmbeddingsFilter
+from metrics import metrics
+import asyncio
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Pinecone-style metadata filter ($eq, $ne, $in, $nin, $and, $or)."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+    return True
+
+
+def source_filter(sources: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Metadata filter restricting retrieval to the chunks of the given documents."""
+    if not sources:
+        return None
+    return {"source": {"$in": sorted(sources)}}
+
+
+class IndexScoreRetriever(BaseRetriever):
+    """Apply the similarity threshold to the scores returned by the index query.
+
+    Equivalent to ``ContextualCompressionRetriever`` + ``EmbeddingsFilter`` on a
+    cosine index, without re-embedding the retrieved chunks.
+    """
+
+    vectorstore: Any
+    k: int = 20
+    similarity_threshold: float = 0.2
+
+    def _filter(self, results: List[Tuple[Document, float]]) -> List[Document]:
+        # Same strict comparison and index order as EmbeddingsFilter
+        return [doc for doc, score in results if score > self.similarity_threshold]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        with metrics.timer("chat_vector_query"):
+            results = self.vectorstore.similarity_search_with_score(query, k=self.k, filter=filter)
+        return self._filter(results)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        with metrics.timer("chat_vector_query"):
+            results = await self.vectorstore.asimilarity_search_with_score(query, k=self.k, filter=filter)
+        return self._filter(results)
+
+
+class TimedEmbeddingsFilter(EmbeddingsFilter):
+    """``EmbeddingsFilter`` that records how long re-embedding the retrieved chunks takes."""
+
+    def compress_documents(self, documents, query, callbacks=None):
+        with metrics.timer("chat_embeddings_filter"):
+            return super().compress_documents(documents, query, callbacks)
+
+    async def acompress_documents(self, documents, query, callbacks=None):
+        with metrics.timer("chat_embeddings_filter"):
+            return await super().acompress_documents(documents, query, callbacks)
+
+
+class BM25Retriever(BaseRetriever):
+    """Lexical retrieval over a ``LexicalIndex``; no embedding call, no vector store round-trip."""
+
+    index: Any
+    k: int = 20
+
+    def search(self, query: str, filter: Optional[Dict[str, Any]] = None) -> Tuple[List[Document], float]:
+        self.index.refresh()
+        where = (lambda metadata: matches_filter(metadata, filter)) if filter else None
+        with metrics.timer("chat_lexical_query"):
+            results, confidence = self.index.search(query, k=self.k, where=where)
+        return [doc for doc, _ in results], confidence
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return self.search(query, filter)[0]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return (await asyncio.to_thread(self.search, query, filter))[0]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Merge ranked lists by summing ``1 / (rrf_k + rank)``; chunks are identified by id, else by text."""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ordered[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 and dense retrieval fused by reciprocal rank.
+
+    When the best lexical hit has a confidence of at least
+    ``shortcut_confidence`` (see ``LexicalIndex.search``), the lexical results
+    are returned alone and the query embedding is never computed. A
+    ``shortcut_confidence`` of 0 disables the shortcut.
+    """
+
+    lexical: BM25Retriever
+    dense: BaseRetriever
+    k: int = 20
+    rrf_k: int = 60
+    shortcut_confidence: float = 0.0
+    stats: Dict[str, int] = Field(default_factory=lambda: {"queries": 0, "shortcuts": 0})
+
+    def _shortcut(self, confidence: float) -> bool:
+        self.stats["queries"] += 1
+        if self.shortcut_confidence and confidence >= self.shortcut_confidence:
+            self.stats["shortcuts"] += 1
+            metrics.inc("lexical_shortcuts_total")
+            return True
+        return False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        lexical, confidence = self.lexical.search(query, filter)
+        if self._shortcut(confidence):
+            return lexical
+        kwargs = {"filter": filter} if filter else {}
+        dense = self.dense.invoke(query, config={"callbacks": run_manager.get_child()}, **kwargs)
+        return reciprocal_rank_fusion([dense, lexical], self.k, self.rrf_k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        lexical, confidence = await asyncio.to_thread(self.lexical.search, query, filter)
+        if self._shortcut(confidence):
+            return lexical
+        kwargs = {"filter": filter} if filter else {}
+        dense = await self.dense.ainvoke(query, config={"callbacks": run_manager.get_child()}, **kwargs)
+        return reciprocal_rank_fusion([dense, lexical], self.k, self.rrf_k)
@@ -0,0 +1,158 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+from metrics import metrics
+import time
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted: the wait queue is full or the wait timed out."""
+
+
+_DEFAULT = object()
+
+
+@dataclass
+class _Waiter:
+    client_id: str
+    future: asyncio.Future
+    on_position: Optional[Callable[[int], Awaitable[Any]]] = None
+    last_position: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class FairScheduler:
+    """Global concurrency limit for upstream LLM/embedding work with per-client round-robin.
+
+    At most ``max_concurrent`` holders run at once. Waiters are queued per
+    ``client_id`` and slots are handed out one client at a time in rotation, so a
+    client with many tabs cannot starve the others. ``on_position`` callbacks are
+    told the waiter's place in line whenever it changes.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 64, queue_timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting: "OrderedDict[str, deque[_Waiter]]" = OrderedDict()
+        self.rotation: deque = deque()
+        self._tasks: set = set()
+        self.stats: Dict[str, float] = {"admitted": 0, "queued": 0, "rejected_full": 0,
+                                        "rejected_timeout": 0, "total_wait_s": 0.0, "max_wait_s": 0.0}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self.waiting.values())
+
+    @asynccontextmanager
+    async def slot(self, client_id: str, on_position=None, timeout: Any = _DEFAULT, bounded: bool = True):
+        await self.acquire(client_id, on_position, timeout, bounded)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, client_id: str, on_position=None, timeout: Any = _DEFAULT, bounded: bool = True) -> None:
+        timeout = self.queue_timeout if timeout is _DEFAULT else timeout
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return
+        if bounded and self.queued >= self.max_queue:
+            self.stats["rejected_full"] += 1
+            raise AdmissionRejected("Too many requests are waiting.")
+
+        waiter = _Waiter(client_id=client_id, future=asyncio.get_running_loop().create_future(), on_position=on_position)
+        if client_id not in self.waiting:
+            self.waiting[client_id] = deque()
+            self.rotation.append(client_id)
+        self.waiting[client_id].append(waiter)
+        self.stats["queued"] += 1
+        self._notify_positions()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._remove(waiter)
+                waiter.future.cancel()
+                self.stats["rejected_timeout"] += 1
+                raise AdmissionRejected("Timed out waiting for a free slot.")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # The slot was granted just as we were cancelled
+            else:
+                self._remove(waiter)
+                waiter.future.cancel()
+            raise
+
+        waited = time.monotonic() - waiter.enqueued_at
+        metrics.observe("scheduler_wait_seconds", waited)
+        self.stats["total_wait_s"] += waited
+        self.stats["max_wait_s"] = max(self.stats["max_wait_s"], waited)
+
+    def release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        waiters = self.waiting.get(waiter.client_id)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self.waiting[waiter.client_id]
+            self.rotation.remove(waiter.client_id)
+        self._notify_positions()
+
+    def _dispatch(self) -> None:
+        while self.active < self.max_concurrent and self.rotation:
+            client_id = self.rotation.popleft()
+            waiters = self.waiting[client_id]
+            waiter = waiters.popleft()
+            if waiters:
+                self.rotation.append(client_id)
+            else:
+                del self.waiting[client_id]
+            if waiter.future.done():
+                continue
+            self.active += 1
+            self.stats["admitted"] += 1
+            waiter.future.set_result(None)
+        self._notify_positions()
+
+    def _order(self) -> List[Tuple[_Waiter, int]]:
+        """Waiters in the order round-robin will admit them, with 1-based positions."""
+        queues = [list(self.waiting[client_id]) for client_id in self.rotation]
+        order = []
+        depth = 0
+        while any(depth < len(queue) for queue in queues):
+            for queue in queues:
+                if depth < len(queue):
+                    order.append(queue[depth])
+            depth += 1
+        return [(waiter, position) for position, waiter in enumerate(order, start=1)]
+
+    def _notify_positions(self) -> None:
+        for waiter, position in self._order():
+            if waiter.on_position is None or waiter.last_position == position:
+                continue
+            waiter.last_position = position
+            task = asyncio.ensure_future(waiter.on_position(position))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def describe(self) -> Dict[str, Any]:
+        admitted = self.stats["admitted"] or 1
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queued_now": self.queued,
+            "waiting_clients": len(self.waiting),
+            "max_queue": self.max_queue,
+            "avg_wait_s": self.stats["total_wait_s"] / admitted,
+            **self.stats,
+        }
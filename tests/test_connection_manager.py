@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from connection_manager import ConnectionManager
+
+
+class StalledWebSocket:
+    """Accepts the connection, then never completes a send until released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        await self.release.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def test_drop_policy_is_rejected():
+    with pytest.raises(ValueError):
+        ConnectionManager(policy="drop")
+
+
+@pytest.mark.parametrize("frame_type", ["stream", "delta"])
+def test_coalesced_frames_lose_no_answer_text(frame_type):
+    async def run():
+        manager = ConnectionManager(max_queue=2)
+        websocket = StalledWebSocket()
+        _, unique_id = await manager.connect("client", websocket)
+        text = ""
+        for seq, token in enumerate(["a", " b", " ", "c", "\n", "d"]):
+            text += token
+            content = text if frame_type == "stream" else token
+            await manager.send_json(unique_id, {"type": frame_type, "seq": seq, "content": content})
+        await manager.send_json(unique_id, {"type": "done", "content": ""})
+        depth = len(manager.active_connections[unique_id].queue)
+        websocket.release.set()
+        await manager.disconnect(unique_id)
+        return websocket.sent, depth, text
+
+    sent, depth, text = asyncio.run(run())
+    assert depth <= 3 and sent[-1]["type"] == "done"
+    frames = [frame["content"] for frame in sent[:-1]]
+    assert (frames[-1] if frame_type == "stream" else "".join(frames)) == text
+
+
+def test_back_to_back_answers_keep_their_first_seq():
+    async def run():
+        manager = ConnectionManager(max_queue=2)
+        websocket = StalledWebSocket()
+        _, unique_id = await manager.connect("client", websocket)
+        for answer in (["Old", " answer"], ["New", " reply"]):
+            for seq, token in enumerate(answer):
+                await manager.send_json(unique_id, {"type": "delta", "seq": seq, "content": token})
+            await manager.send_json(unique_id, {"type": "done", "content": ""})
+        websocket.release.set()
+        await manager.disconnect(unique_id)
+        return websocket.sent
+
+    # Every answer must still open with a seq 0 frame, which is what resets the client's text
+    answers, text = [], ""
+    for frame in asyncio.run(run()):
+        if frame["type"] == "done":
+            answers.append(text)
+        else:
+            text = frame["content"] if frame["seq"] == 0 else text + frame["content"]
+    assert answers == ["Old answer", "New reply"]
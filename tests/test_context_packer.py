@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain.schema import Document
+from langchain_pinecone import PineconeVectorStore
+
+from fakes import FakeEmbeddings
+from llm.context_packer import ContextPacker
+from registry import RetrievalRegistry
+
+
+class FakePineconeIndex:
+    """Answers ``fetch`` like a Pinecone index holding ``records`` (id -> metadata)."""
+
+    config = SimpleNamespace(host="fake-index", api_key="test")
+
+    def __init__(self, records):
+        self.records = records
+        self.fetched = []
+
+    def fetch(self, ids, namespace=None):
+        self.fetched.append(list(ids))
+        return SimpleNamespace(vectors={id_: SimpleNamespace(id=id_, values=[1.0], metadata=dict(self.records[id_]))
+                                        for id_ in ids if id_ in self.records})
+
+
+def pinecone_registry(index):
+    registry = RetrievalRegistry({'vector_backend': 'pinecone'}, chain_factory=None)
+    registry.vectorstore = PineconeVectorStore(index=index, embedding=FakeEmbeddings())
+    return registry
+
+
+def chunk(text, table_ids=()):
+    return Document(page_content=text, metadata={"page": 1, "table_ids": list(table_ids)})
+
+
+def test_pinecone_tables_not_retrieved_are_fetched_from_the_index():
+    index = FakePineconeIndex({"table-1": {"text": "| a | b |", "type": "table", "table_id": "table-1", "page": 1}})
+    packer = ContextPacker(max_tokens=1000, table_lookup=pinecone_registry(index)._table_lookup())
+
+    packed = asyncio.run(packer.pack([chunk("see table 1", ["table-1", "table-missing"]), chunk("other text")]))
+
+    assert [doc.page_content for doc in packed] == ["see table 1", "| a | b |", "other text"]
+    assert packed[1].id == "table-1" and "text" not in packed[1].metadata
+    assert index.fetched == [["table-1", "table-missing"]]
+    assert packer.stats["tables_fetched"] == 1
+
+
+def test_tables_of_a_chunk_over_budget_are_left_out():
+    table = Document(id="table-1", page_content="| a | b |", metadata={"type": "table", "table_id": "table-1"})
+    packer = ContextPacker(max_tokens=20)
+
+    packed = asyncio.run(packer.pack([chunk("x" * 200, ["table-1"]), chunk("short text", ["table-1"]), table]))
+
+    # The long chunk is skipped; the table still goes in after the next chunk that cites it
+    assert [doc.page_content for doc in packed] == ["short text", "| a | b |"]
+
+
+def test_tables_cited_only_by_skipped_chunks_are_not_packed():
+    table = Document(id="table-1", page_content="| a | b |", metadata={"type": "table", "table_id": "table-1"})
+
+    async def lookup(ids):
+        return [table]
+
+    packer = ContextPacker(max_tokens=20, table_lookup=lookup)
+
+    packed = asyncio.run(packer.pack([chunk("x" * 200, ["table-1"]), chunk("short text")]))
+
+    assert [doc.page_content for doc in packed] == ["short text"]
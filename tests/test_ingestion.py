@@ -0,0 +1,49 @@
+import asyncio
+import os
+import time
+
+from fakes import FakeEmbeddings
+from ingestion import IngestionManager
+from local_vectordb import LocalVectorDB
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents", "2412.19437v2.pdf")
+
+
+class FailingEmbeddings(FakeEmbeddings):
+    failed_at = None
+
+    async def aembed_documents(self, texts):
+        self.failed_at = time.perf_counter()
+        raise ValueError("embedding service down")
+
+
+def run_job(manager, vectordb):
+    job = manager.create_job("sample.pdf", SAMPLE)
+    try:
+        asyncio.run(manager.run(job, vectordb))
+    finally:
+        manager.close()
+    return job
+
+
+def test_failed_parallel_job_does_not_wait_for_the_remaining_batches(tmp_path):
+    embeddings = FailingEmbeddings(dimension=32)
+    vectordb = LocalVectorDB(None, "test-index", data_dir=str(tmp_path), embeddings=embeddings)
+
+    job = run_job(IngestionManager(batch_pages=1, workers=2), vectordb)
+
+    assert job.status == "failed" and job.pages_done < job.pages_total
+    assert job.finished_at is not None and time.perf_counter() - embeddings.failed_at < 1.0
+
+
+def test_parallel_extraction_matches_the_serial_path(tmp_path):
+    stores = {}
+    for workers in (1, 2):
+        vectordb = LocalVectorDB(None, "test-index", data_dir=str(tmp_path / str(workers)),
+                                 embeddings=FakeEmbeddings(dimension=32))
+        job = run_job(IngestionManager(batch_pages=8, workers=workers), vectordb)
+        assert job.status == "completed" and job.pages_done == job.pages_total
+        assert vectordb.count == job.vectors_upserted > 0
+        stores[workers] = list(zip(vectordb.ids, vectordb.texts, vectordb.metadatas))
+
+    assert stores[1] == stores[2]
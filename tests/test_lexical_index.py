@@ -0,0 +1,78 @@
+import os
+import statistics
+import time
+
+import pytest
+
+from lexical_index import LexicalIndex
+from utils import PDFProcessor
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents", "2412.19437v2.pdf")
+# (query, term the top hit must contain)
+EXACT_TERM_QUERIES = [
+    ("Table 3", "table 3"),
+    ("MTP", "mtp"),
+    ("DeepSeek-V3 training cost in H800 GPU hours", "h800"),
+    ("auxiliary-loss-free load balancing", "auxiliary-loss-free"),
+    ("FP8 mixed precision training framework", "fp8"),
+    ("What is multi-head latent attention?", "latent attention"),
+    ("DualPipe", "dualpipe"),
+]
+# "tokens" is in most chunks, so this one has no exact-term guarantee
+QUERIES = [query for query, _ in EXACT_TERM_QUERIES] + ["How many tokens was the model pre-trained on?"]
+
+# Loose bounds, well above what benchmarks/bench_lexical.py reports for the sample paper
+# (about 70 ms to build, 0.3 ms per query, 1.9x the chunk text on disk)
+MAX_BUILD_SECONDS = 2.0
+MAX_QUERY_MS = 10.0
+MAX_SIZE_RATIO = 4.0
+
+
+@pytest.fixture(scope="module")
+def documents():
+    return PDFProcessor(SAMPLE).process()
+
+
+@pytest.fixture(scope="module")
+def built(documents, tmp_path_factory):
+    start = time.perf_counter()
+    index = LexicalIndex(tmp_path_factory.mktemp("bm25") / "sample.bm25.json")
+    index.update(added=((str(i), doc.page_content, doc.metadata) for i, doc in enumerate(documents)))
+    return index, time.perf_counter() - start
+
+
+@pytest.fixture(scope="module")
+def index(built):
+    return built[0]
+
+
+@pytest.mark.parametrize("query,term", EXACT_TERM_QUERIES)
+def test_exact_term_queries_put_a_chunk_with_the_term_first(index, query, term):
+    results, confidence = index.search(query, k=20)
+    assert results and term in results[0][0].page_content.lower()
+    assert 0.0 < confidence <= 1.0
+
+
+def test_reloaded_index_gives_the_same_results(index):
+    reloaded = LexicalIndex(index.path)
+    for query in QUERIES:
+        assert ([doc.id for doc, _ in reloaded.search(query, k=20)[0]] ==
+                [doc.id for doc, _ in index.search(query, k=20)[0]])
+
+
+def test_build_time_and_size(built, documents):
+    index, build_seconds = built
+    stats = index.describe()
+    assert stats["chunks"] == len(documents)
+    assert build_seconds < MAX_BUILD_SECONDS
+    assert 0 < stats["bytes_on_disk"] < MAX_SIZE_RATIO * sum(len(doc.page_content) for doc in documents)
+
+
+def test_query_latency(index):
+    for query in QUERIES:
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            index.search(query, k=20)
+            timings.append(time.perf_counter() - start)
+        assert statistics.median(timings) * 1000 < MAX_QUERY_MS, query
@@ -0,0 +1,43 @@
+import asyncio
+
+from llm.llm_utils import coalesce_deltas, get_ai_deltas, get_ai_response
+
+TOKENS = ["Multi", "-token", " ", "prediction", "\n", "\n", "  ", "(MTP)", "", " \t", "densifies", " ", "training",
+          " signals", ".", "\n"]
+
+
+class FakeChain:
+    """Streams like RagPipeline: the context first, then the answer one token per chunk."""
+
+    def __init__(self, tokens, delay=0.0):
+        self.tokens = tokens
+        self.delay = delay
+
+    async def astream(self, input, config):
+        yield {"context": []}
+        for token in self.tokens:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield {"answer": token}
+
+
+async def v1_text(chain):
+    text = ""
+    async for text in get_ai_response("question", chain, "session"):
+        pass
+    return text
+
+
+async def v2_frames(chain, interval, max_bytes):
+    deltas = get_ai_deltas("question", chain, "session")
+    return [frame async for frame in coalesce_deltas(deltas, interval=interval, max_bytes=max_bytes)]
+
+
+def test_joined_v2_deltas_match_the_v1_text():
+    expected = "".join(TOKENS)
+    assert asyncio.run(v1_text(FakeChain(TOKENS))) == expected
+    for delay, interval, max_bytes in [(0.0, 0.03, 256), (0.0, 0.03, 4), (0.005, 0.001, 256), (0.002, 0.01, 8)]:
+        frames = asyncio.run(v2_frames(FakeChain(TOKENS, delay), interval, max_bytes))
+        assert "".join(frames) == expected
+        # The first token goes out alone; whitespace-only tokens are kept, never sent as empty frames
+        assert frames[0] == TOKENS[0] and all(frames)
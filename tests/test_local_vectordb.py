@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+from langchain.schema import Document
+
+import registry
+from fakes import FakeEmbeddings, FakeStreamingChatModel
+from local_vectordb import LocalVectorDB
+
+
+def chunks(prefix, n):
+    return [Document(page_content=f"{prefix} chunk {i}", metadata={"page": i + 1}) for i in range(n)]
+
+
+def store(path):
+    return LocalVectorDB(None, "test-index", data_dir=str(path), embeddings=FakeEmbeddings(dimension=32))
+
+
+def test_writes_through_another_handle_are_picked_up(tmp_path):
+    reader, writer = store(tmp_path), store(tmp_path)
+    writer.add_documents(chunks("a", 5), "a.pdf")
+    writer.add_documents(chunks("b", 5), "b.pdf")
+
+    [(doc, _)] = reader.similarity_search_with_score("b chunk 3", k=1)
+    assert reader.count == 10 and doc.page_content == "b chunk 3"
+
+    # Swap-removal moves rows; the reader must not pair old ids/texts with the moved vectors
+    writer.delete_documents([doc.id for doc, _ in writer.similarity_search_with_score("a chunk 0", k=10)
+                             if doc.metadata["source"] == "a.pdf"])
+    for i in range(5):
+        [(doc, score)] = reader.similarity_search_with_score(f"b chunk {i}", k=1)
+        assert doc.page_content == f"b chunk {i}" and score > 0.99
+    assert reader.count == 5
+
+
+def test_local_uploads_go_through_the_chat_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "create_embeddings", lambda **kwargs: FakeEmbeddings(dimension=32))
+    monkeypatch.setattr(registry, "create_llm", lambda **kwargs: FakeStreamingChatModel())
+    config = {'openai_key': 'test', 'llm_model': 'fake', 'llm_temperature': 0, 'vector_backend': 'local', 'local_index_dir': str(tmp_path),
+              'answer_cache_enabled': False}
+    stack = registry.RetrievalRegistry(config, chain_factory=lambda *args: object())
+
+    db = stack.get_document_db()
+    db.add_documents(chunks("a", 3), "a.pdf")
+    assert db is stack.vectorstore and stack.vectorstore.count == 3
+
+
+def test_empty_batches_are_a_no_op(tmp_path):
+    db = store(tmp_path)
+    assert db.add_embeddings([], [], [], []) == []
+    assert db.add_documents([], "scanned.pdf") == []
+    db.add_documents(chunks("a", 2), "a.pdf")
+    assert db.add_embeddings([], [], []) == [] and db.count == 2
+
+
+def test_ann_index_is_built_off_the_query_path(tmp_path):
+    db = LocalVectorDB(None, "test-index", data_dir=str(tmp_path), embeddings=FakeEmbeddings(dimension=32),
+                       ann_min_vectors=8, ann_lists=2, ann_probes=1)
+    release, cluster = threading.Event(), db._cluster
+    db._cluster = lambda data: release.wait() and cluster(data)
+    db.add_documents(chunks("a", 16), "a.pdf")
+
+    # While the k-means is stuck, queries are answered exactly instead of waiting on it
+    [(doc, score)] = db.similarity_search_with_score("a chunk 7", k=1)
+    assert doc.page_content == "a chunk 7" and score > 0.99 and db._centroids is None
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while db._centroids is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert db._centroids is not None and not db._ann_building
+    [(doc, _)] = db.similarity_search_with_score("a chunk 7", k=1)
+    assert doc.page_content == "a chunk 7"
+
+
+def test_callers_vectors_are_not_normalised_in_place(tmp_path):
+    db = store(tmp_path)
+    embeddings = np.full((2, 32), 3.0, dtype=np.float32)
+    query = np.full(32, 3.0, dtype=np.float32)
+    db.add_embeddings(["a", "b"], embeddings, [{}, {}])
+    db.search_by_vector(query, k=1)
+    assert (embeddings == 3.0).all() and (query == 3.0).all()
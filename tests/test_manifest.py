@@ -0,0 +1,23 @@
+import threading
+
+from manifest import DocumentManifest
+
+
+def test_handles_in_other_workers_see_and_keep_each_others_documents(tmp_path):
+    path = tmp_path / "index.manifest.json"
+    first, second = DocumentManifest(path), DocumentManifest(path)
+
+    first.record("a.pdf", "hash-a", {1: "page-a"}, {1: ["a-1"]})
+    assert second.has_file("hash-a") and second.page_ids("a.pdf", [1]) == ["a-1"]
+
+    # Each handle is stale when it writes; neither may drop the other's document
+    threads = [threading.Thread(target=manifest.record, args=(f"{name}.pdf", f"hash-{name}", {1: "p"}, {1: [name]}))
+               for manifest in (first, second) for name in (f"{id(manifest)}-{i}" for i in range(20))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    second.remove("a.pdf")
+
+    fresh = DocumentManifest(path)
+    assert len(fresh.documents) == 40 and not first.has_file("hash-a") and fresh.version == 42
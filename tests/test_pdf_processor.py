@@ -0,0 +1,65 @@
+import os
+import time
+
+import fitz
+
+from utils import PDFProcessor
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents", "2412.19437v2.pdf")
+
+
+def xobject_pdf(path, pages, replace=None):
+    """Each page shows one page of the sample through a Form XObject, optionally swapping one source page."""
+    src = fitz.open(SAMPLE)
+    out = fitz.open()
+    for i in pages:
+        source_page = replace.get(i, i) if replace else i
+        page = out.new_page(width=src[source_page].rect.width, height=src[source_page].rect.height)
+        page.show_pdf_page(page.rect, src, source_page)
+    out.save(path)
+    return str(path)
+
+
+def test_page_hashes_see_through_form_xobjects(tmp_path):
+    before = PDFProcessor(xobject_pdf(tmp_path / "before.pdf", [0, 1, 2])).page_hashes()
+    after = PDFProcessor(xobject_pdf(tmp_path / "after.pdf", [0, 1, 2], replace={1: 5})).page_hashes()
+
+    assert len(set(before.values())) == 3
+    assert [page for page in before if before[page] != after[page]] == [2]
+
+
+def table_ids(processor):
+    processor.extract_tables()
+    return {id_ for page_tables in processor.tables_by_page.values() for id_, _ in page_tables}
+
+
+def test_table_screen_keeps_every_table_and_document():
+    strict = PDFProcessor(SAMPLE, strict_tables=True)
+    screened = PDFProcessor(SAMPLE)
+    strict_ids = table_ids(strict)
+
+    assert strict_ids and table_ids(screened) == strict_ids
+    assert set(strict.tables_by_page) <= set(screened.table_pages())
+
+    def timed_documents(processor):
+        start = time.perf_counter()
+        documents = [(doc.page_content, doc.metadata) for doc in processor.iter_documents()]
+        return documents, time.perf_counter() - start
+
+    screened_documents, screened_seconds = timed_documents(PDFProcessor(SAMPLE))
+    strict_documents, strict_seconds = timed_documents(PDFProcessor(SAMPLE, strict_tables=True))
+    assert screened_documents == strict_documents
+    # Loose: bench_table_screen measures the screened extraction at under half the strict time
+    assert screened_seconds < strict_seconds
+
+
+def test_token_capped_chunks_keep_every_word():
+    whole = PDFProcessor(SAMPLE)
+    whole_chunks = [text for page in range(10) for text in whole._text_blocks(page)]
+    words = [word for text in whole_chunks for word in text.split()]
+
+    for chunk_tokens in (50, 30, 25, 10):
+        capped = PDFProcessor(SAMPLE, chunk_tokens=chunk_tokens)
+        chunks = [text for page in range(10) for text in capped._text_blocks(page)]
+        assert len(chunks) > len(whole_chunks)
+        assert [word for text in chunks for word in text.split()] == words
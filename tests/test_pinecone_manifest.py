@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from vectordb import PineconeManifest
+
+
+class FakeIndex:
+    """The namespaced record calls of a Pinecone index that the manifest uses."""
+
+    def __init__(self):
+        self.namespaces = {}
+
+    def upsert(self, vectors, namespace):
+        for vector in vectors:
+            self.namespaces.setdefault(namespace, {})[vector["id"]] = vector
+
+    def delete(self, ids, namespace):
+        for id_ in ids:
+            self.namespaces.get(namespace, {}).pop(id_, None)
+
+    def fetch(self, ids, namespace):
+        records = self.namespaces.get(namespace, {})
+        return SimpleNamespace(vectors={id_: SimpleNamespace(id=id_, metadata=records[id_]["metadata"])
+                                        for id_ in ids if id_ in records})
+
+    def list(self, namespace, prefix=""):
+        ids = sorted(id_ for id_ in self.namespaces.get(namespace, {}) if id_.startswith(prefix))
+        for start in range(0, len(ids), 100):
+            yield ids[start:start + 100]
+
+
+def test_replicas_share_the_manifest_through_the_index():
+    index = FakeIndex()
+    first, second = PineconeManifest(index, 8, refresh_seconds=0), PineconeManifest(index, 8, refresh_seconds=0)
+
+    first.record("a.pdf", "hash-a", {1: "p1", 2: "p2"}, {1: ["a-1", "a-2"], 2: []})
+    # A fresh container has no local state, only the index
+    fresh = PineconeManifest(index, 8)
+    assert fresh.has_file("hash-a") and fresh.page_ids("a.pdf", [1, 2]) == ["a-1", "a-2"]
+    assert fresh.summary() == [{"filename": "a.pdf", "sha256": "hash-a", "pages": 2, "vectors": 2}]
+
+    # A stale replica keeps the other replica's document when it writes its own
+    version = second.version
+    second.record("b.pdf", "hash-b", {1: "q1"}, {1: ["b-1"]})
+    assert first.current_version() != version and set(first.documents) == {"a.pdf", "b.pdf"}
+
+    # Re-recording with fewer pages drops the page records that are gone; a page left out of page_ids keeps its ids
+    first.record("a.pdf", "hash-a2", {1: "p1"}, {})
+    assert second.page_ids("a.pdf", [1, 2]) == ["a-1", "a-2"] and not second.has_file("hash-a")
+    assert second.remove("a.pdf") == ["a-1", "a-2"]
+    key = PineconeManifest._key("b.pdf")
+    assert sorted(index.namespaces["__manifest__"]) == [f"doc:{key}", f"page:{key}:1", "version"]
+    assert set(PineconeManifest(index, 8).documents) == {"b.pdf"}
@@ -0,0 +1,41 @@
+import asyncio
+import gc
+
+import pytest
+from langchain_core.retrievers import BaseRetriever
+
+from fakes import FakeStreamingChatModel
+from llm import session_history
+from llm.chat import contextualize_q_prompt, question_answer_prompt
+from llm.rag_pipeline import RagPipeline
+
+
+class RawQuestionFails(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        raise ConnectionError("index unreachable")
+
+
+class FailingRewrite(FakeStreamingChatModel):
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(0.05)
+        raise TimeoutError("rewrite timed out")
+
+
+def test_a_discarded_speculative_failure_is_not_reported_as_lost(monkeypatch):
+    store = session_history.SessionStore()
+    monkeypatch.setattr(session_history, "store", store)
+    store.get("s1").add_user_message("Earlier question")
+    pipeline = RagPipeline(RawQuestionFails(), FailingRewrite(), contextualize_q_prompt, question_answer_prompt,
+                           speculative=True)
+
+    async def run():
+        lost = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: lost.append(context["message"]))
+        with pytest.raises(TimeoutError):
+            async for _ in pipeline.astream({"input": "What is MTP?"}, config={"configurable": {"session_id": "s1"}}):
+                pass
+        gc.collect()
+        await asyncio.sleep(0)
+        return lost
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,48 @@
+from langchain.retrievers import ContextualCompressionRetriever
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from local_vectordb import LocalVectorDB
+from retrievers import IndexScoreRetriever, TimedEmbeddingsFilter
+
+# Cosine similarity of each chunk with the query [1, 0, 0, 0]; 0.5 is exact in float32 and float64
+VECTORS = {
+    "query": [1.0, 0.0, 0.0, 0.0],
+    "same direction": [2.0, 0.0, 0.0, 0.0],  # 1.0
+    "mostly related": [1.0, 1.0, 1.0, 0.0],  # 0.577
+    "on the threshold": [1.0, 1.0, 1.0, 1.0],  # 0.5
+    "orthogonal": [0.0, 1.0, 0.0, 0.0],  # 0.0
+    "opposite": [-1.0, 0.0, 1.0, 0.0],  # -0.707
+}
+
+
+class TableEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+def fake_store(tmp_path):
+    store = LocalVectorDB(None, "test-index", data_dir=str(tmp_path), embeddings=TableEmbeddings())
+    store.add_documents([Document(page_content=text, metadata={"page": 1}) for text in VECTORS if text != "query"],
+                        "test.pdf")
+    return store
+
+
+def test_index_scores_keep_the_same_chunks_as_embeddings_filter(tmp_path):
+    store = fake_store(tmp_path)
+    for threshold in (-1.0, 0.0, 0.2, 0.5, 0.9):
+        index_scores = IndexScoreRetriever(vectorstore=store, k=10, similarity_threshold=threshold)
+        compression = ContextualCompressionRetriever(
+            base_compressor=TimedEmbeddingsFilter(embeddings=store.embeddings, similarity_threshold=threshold),
+            base_retriever=store.as_retriever(search_kwargs={"k": 10}),
+        )
+        kept = [doc.page_content for doc in index_scores.invoke("query")]
+        assert kept == [doc.page_content for doc in compression.invoke("query")]
+
+
+def test_threshold_is_exclusive(tmp_path):
+    retriever = IndexScoreRetriever(vectorstore=fake_store(tmp_path), k=10, similarity_threshold=0.5)
+    assert [doc.page_content for doc in retriever.invoke("query")] == ["same direction", "mostly related"]
@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from langchain_core.retrievers import BaseRetriever
+
+from fakes import FakeStreamingChatModel
+from llm import session_history
+from llm.chat import contextualize_q_prompt, question_answer_prompt
+from llm.rag_pipeline import RagPipeline
+
+
+class NoDocuments(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return []
+
+
+def test_a_locked_sqlite_store_does_not_stall_the_event_loop(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "sessions.db")
+    monkeypatch.setattr(session_history, "store", session_history.SessionStore(backend="sqlite", db_path=db_path))
+    llm = FakeStreamingChatModel(answer_tokens=3, first_token_ms=0, rewrite_ms=0, tokens_per_second=1000)
+    pipeline = RagPipeline(NoDocuments(), llm, contextualize_q_prompt, question_answer_prompt)
+
+    # Another worker holds the write lock for a while
+    other = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.5, lambda: other.execute("COMMIT")).start()
+
+    async def run():
+        gaps, stop = [], asyncio.Event()
+
+        async def tick():
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+                gaps.append(time.perf_counter() - last)
+                last = time.perf_counter()
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0.05)
+        answer = [chunk["answer"] async for chunk in pipeline.astream(
+            {"input": "What is MTP?"}, config={"configurable": {"session_id": "s1"}}) if "answer" in chunk]
+        stop.set()
+        await ticker
+        return answer, max(gaps)
+
+    answer, worst_gap = asyncio.run(run())
+    assert "".join(answer) and worst_gap < 0.2
+    assert len(session_history.store.get("s1").messages) == 2
+
+
+def test_session_is_dropped_when_the_connection_task_is_cancelled(monkeypatch):
+    import main
+
+    store = session_history.SessionStore()
+    monkeypatch.setattr(session_history, "store", store)
+
+    class SlowClose:
+        async def accept(self):
+            pass
+
+        async def send_json(self, message):
+            pass
+
+        async def close(self, code=1000, reason=""):
+            await asyncio.sleep(10)
+
+    async def run():
+        opened = asyncio.Event()
+
+        async def connection():
+            async with main.manage_connection(SlowClose(), "client") as (session_id, _):
+                store.get(session_id)
+                opened.set()
+
+        task = asyncio.create_task(connection())
+        await opened.wait()
+        await asyncio.sleep(0.05)
+        # Shutdown cancels the handler while it is still closing the socket
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert not store.sessions and store.evictions["closed"] == 1
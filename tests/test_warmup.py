@@ -0,0 +1,28 @@
+import asyncio
+
+import main
+
+
+def test_failed_warm_up_is_retried_until_ready(monkeypatch):
+    calls = []
+
+    def flaky_warm_up():
+        calls.append(len(calls))
+        if len(calls) < 3:
+            raise ConnectionError("index unreachable")
+
+    monkeypatch.setattr(main.registry, "warm_up", flaky_warm_up)
+    monkeypatch.setattr(main.ingestion, "warm_up", lambda: None)
+    warmup = main.WarmUp(backoff=0.01)
+
+    async def run():
+        task = warmup.start()
+        await warmup.done.wait()
+        # The first failure releases waiting sessions but the worker is not ready yet
+        state = warmup.describe()
+        await task
+        return state
+
+    first = asyncio.run(run())
+    assert first["ready"] is False and first["error"] == "index unreachable"
+    assert warmup.ready and warmup.error is None and warmup.attempts == 3 == len(calls)
@@ -1,84 +1,261 @@
-from vectordb import PineconeDB
 import os
 from langchain.schema import Document
 import uuid
 import fitz
 import pdfplumber
+from pdfplumber.table import merge_edges, edges_to_intersections, intersections_to_cells
+from contextlib import nullcontext
+import hashlib
+from metrics import metrics
+
+
+def extract_page_batch(pdf_path, pages, chunk_tokens=0, strict_tables=False):
+    """Return the Documents for the given page indexes, for use from a worker process."""
+    return PDFProcessor(pdf_path, chunk_tokens=chunk_tokens, strict_tables=strict_tables).process_pages(pages)
+
+
+def table_id(pdf_path, page_num, table_text):
+    """Stable id of a table record, so re-extracting an unchanged page yields the same id."""
+    key = f"{os.path.basename(pdf_path)}\n{page_num}\n{table_text}"
+    return "table-" + hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _ruling_edges(page):
+    """Horizontal and vertical segments of a PyMuPDF page's vector paths, as pdfplumber edge dicts."""
+    edges = []
+
+    def add(a, b, single_line=False):
+        (ax, ay), (bx, by) = a, b
+        x0, x1 = min(ax, bx), max(ax, bx)
+        top, bottom = min(ay, by), max(ay, by)
+        # pdfplumber treats every non-horizontal line as vertical, but drops slanted curve segments
+        if bottom - top < 0.01:
+            orientation = "h"
+        elif x1 - x0 < 0.01 or single_line:
+            orientation = "v"
+        else:
+            return
+        edges.append({"x0": x0, "x1": x1, "top": top, "bottom": bottom,
+                      "width": x1 - x0, "height": bottom - top, "orientation": orientation})
+
+    for path in page.get_cdrawings():
+        items = path["items"]
+        for item in items:
+            if item[0] == "re":
+                x0, y0, x1, y1 = item[1]
+                points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+            elif item[0] == "qu":
+                ul, ur, ll, lr = item[1]
+                points = [ul, ur, lr, ll, ul]
+            else:
+                points = item[1:]
+            for a, b in zip(points, points[1:]):
+                add(a, b, single_line=len(items) == 1 and item[0] == "l")
+    return edges
+
+
+def page_fingerprint(page):
+    """SHA-256 of what indexing reads from a PyMuPDF page: its text blocks and its vector paths.
+
+    Both are taken after Form XObjects are resolved, so pages drawn through
+    XObjects hash by what they show rather than by their one-line content
+    stream. Image contents are left out; they are not indexed.
+    """
+    blocks = page.get_text("blocks", flags=fitz.TEXTFLAGS_BLOCKS & ~fitz.TEXT_PRESERVE_IMAGES)
+    digest = hashlib.sha256(str(page.rotation).encode())
+    digest.update(repr(blocks).encode())
+    # Table rulings come from the paths, so a moved line can change the extracted tables
+    digest.update(repr([path["items"] for path in page.get_cdrawings()]).encode())
+    return digest.hexdigest()
+
+
+def has_table_rulings(page):
+    """Whether pdfplumber's default ("lines") table finder could find a cell on this PyMuPDF page.
+
+    Replays its edge snapping, joining and intersection steps on the page's
+    ruling lines from PyMuPDF, which is far cheaper than letting pdfplumber
+    parse the page. Rotated pages are always reported as candidates.
+    """
+    if page.rotation:
+        return True
+    edges = [e for e in _ruling_edges(page) if (e["height"] if e["orientation"] == "v" else e["width"]) >= 1]
+    horizontal = sum(e["orientation"] == "h" for e in edges)
+    if horizontal < 2 or len(edges) - horizontal < 2:
+        return False
+    edges = [e for e in merge_edges(edges, 3, 3, 3, 3)
+             if (e["height"] if e["orientation"] == "v" else e["width"]) >= 3]
+    return bool(intersections_to_cells(edges_to_intersections(edges, 3, 3)))
 
 
 class PDFProcessor:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, chunk_tokens=0, strict_tables=False):
         self.pdf_path = pdf_path
         self.doc = fitz.open(pdf_path)
         self.chunks = []
         self.tables_by_page = {}
+        # Upper bound on a text chunk's estimated tokens; 0 keeps whole paragraphs
+        self.chunk_tokens = chunk_tokens
+        # Run pdfplumber on every page instead of only on pages with ruling lines that form cells
+        self.strict_tables = strict_tables
+
+    def _page_tables(self, page):
+        """(id, text) of each distinct table on a pdfplumber page."""
+        page_num = page.page_number - 1
+        table_texts = []
 
-    def extract_tables(self):
-        with pdfplumber.open(self.pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                tables = page.extract_tables()
-                table_texts = []
+        for table in page.extract_tables():
+            # Convert None values to empty strings
+            cleaned_table = [
+                " | ".join([cell if cell is not None else "" for cell in row])
+                for row in table
+            ]
+            table_text = "\n".join(cleaned_table)
 
-                for table in tables:
-                    # Convert None values to empty strings
-                    cleaned_table = [
-                        " | ".join([cell if cell is not None else "" for cell in row])
-                        for row in table
-                    ]
-                    table_text = "\n".join(cleaned_table)
+            if len(table_text.strip()) > 5 and not table_text.isnumeric():
+                id_ = table_id(self.pdf_path, page_num, table_text)
+                if all(id_ != seen for seen, _ in table_texts):
+                    table_texts.append((id_, table_text))
+        return table_texts
 
-                    
-                    if len(table_text.strip()) > 5 and not table_text.isnumeric():
-                        table_texts.append(table_text)
+    def table_pages(self, pages=None, doc=None):
+        """Pages (0-based) that pdfplumber should scan for tables."""
+        doc = self.doc if doc is None else doc
+        pages = list(range(len(doc)) if pages is None else pages)
+        if self.strict_tables:
+            return pages
+        with metrics.timer("ingest_table_screen"):
+            candidates = [page_num for page_num in pages if has_table_rulings(doc[page_num])]
+        metrics.inc("ingest_table_pages_total", len(candidates), result="scanned")
+        metrics.inc("ingest_table_pages_total", len(pages) - len(candidates), result="skipped")
+        return candidates
 
+    def extract_tables(self, pages=None):
+        page_numbers = [p + 1 for p in self.table_pages(pages)]
+        if not page_numbers:
+            return
+        with metrics.timer("ingest_extract_tables"), pdfplumber.open(self.pdf_path, pages=page_numbers) as pdf:
+            for page in pdf.pages:
+                table_texts = self._page_tables(page)
                 if table_texts:
-                    self.tables_by_page[page_num] = table_texts
+                    self.tables_by_page[page.page_number - 1] = table_texts
 
-    def extract_text(self):
-        """Extract text from the PDF, chunking properly into paragraphs."""
-        for page_num, page in enumerate(self.doc):
-            blocks = page.get_text("dict")["blocks"]
-            prev_bottom = None
-            current_chunk = []
-            text_blocks = []
-
-            for block in blocks:
-                if block["type"] == 0:  # Text Block
-                    for line in block["lines"]:
-                        span_text = " ".join(span["text"] for span in line["spans"])
-
-                        if not span_text.strip():
-                            continue  # Ignore empty lines
-
-                        top = line["bbox"][1]  # Get Y-position of text
-
-                        # **Group text by spacing**
-                        if prev_bottom is not None and (top - prev_bottom) > 15:
-                            if len(" ".join(current_chunk)) > 100:
-                                text_blocks.append(" ".join(current_chunk))
-                            current_chunk = []
-
-                        current_chunk.append(span_text)
-                        prev_bottom = line["bbox"][3]
-
-            # Add last chunk
-            if current_chunk and len(" ".join(current_chunk)) > 100:
-                text_blocks.append(" ".join(current_chunk))
-
-            # Store extracted text along with associated tables
-            for text in text_blocks:
-                chunk_id = str(uuid.uuid4())
-                chunk = {
-                    "id": chunk_id,
-                    "type": "text",
-                    "text": text,
-                    "metadata": {
-                        "page": page_num + 1,
-                        "associated_tables": self.tables_by_page.get(page_num, [])  # Attach extracted tables
-                    }
+    def _text_blocks(self, page_num, doc=None):
+        """Paragraphs of one page: lines grouped by vertical gaps over 15pt, kept if over 100 characters.
+
+        The joined length is tracked as lines are added, so each paragraph is
+        joined once. With ``chunk_tokens`` set, a paragraph is also cut at the
+        line that would take it past that many estimated tokens; the length
+        rule still applies to the whole paragraph, so no piece of it is lost.
+        """
+        max_chars = self.chunk_tokens * 4 if self.chunk_tokens else None
+        blocks = (self.doc if doc is None else doc)[page_num].get_text("dict")["blocks"]
+        prev_bottom = None
+        current_chunk = []
+        length = -1  # len(" ".join(current_chunk))
+        pieces = []  # Finished pieces of the current paragraph
+
+        def paragraph():
+            # Whole paragraphs over 100 characters are kept, with every piece they were cut into
+            if sum(map(len, pieces)) + len(pieces) - 1 > 100:
+                yield from pieces
+
+        for block in blocks:
+            if block["type"] != 0:  # Text blocks only
+                continue
+            for line in block["lines"]:
+                span_text = " ".join(span["text"] for span in line["spans"])
+
+                if not span_text.strip():
+                    continue  # Ignore empty lines
+
+                top = line["bbox"][1]  # Get Y-position of text
+
+                # **Group text by spacing**, or cut when the chunk would get too long
+                new_paragraph = prev_bottom is not None and (top - prev_bottom) > 15
+                too_long = max_chars is not None and current_chunk and length + 1 + len(span_text) > max_chars
+                if new_paragraph or too_long:
+                    pieces.append(" ".join(current_chunk))
+                    current_chunk = []
+                    length = -1
+                if new_paragraph:
+                    yield from paragraph()
+                    pieces = []
+
+                current_chunk.append(span_text)
+                length += 1 + len(span_text)
+                prev_bottom = line["bbox"][3]
+
+        # Add last chunk
+        if current_chunk:
+            pieces.append(" ".join(current_chunk))
+        yield from paragraph()
+
+    def _page_chunks(self, page_num, tables, doc=None):
+        """Chunk dicts of one page: its text blocks, then each of its tables once."""
+        table_ids = [id_ for id_, _ in tables]
+        for text in self._text_blocks(page_num, doc):
+            yield {
+                "id": str(uuid.uuid4()),
+                "type": "text",
+                "text": text,
+                "metadata": {
+                    "page": page_num + 1,
+                    "table_ids": table_ids
                 }
-                self.chunks.append(chunk)
-    from langchain.schema import Document
+            }
+
+        # Each table is stored once, as its own record
+        for id_, table_text in tables:
+            yield {
+                "id": id_,
+                "type": "table",
+                "text": table_text,
+                "metadata": {"page": page_num + 1}
+            }
+
+    def extract_text(self, pages=None):
+        """Extract text from the PDF, chunking properly into paragraphs."""
+        with metrics.timer("ingest_extract_text"):
+            if pages is None:
+                pages = range(len(self.doc))
+            for page_num in pages:
+                self.chunks.extend(self._page_chunks(page_num, self.tables_by_page.get(page_num, [])))
+
+    def iter_documents(self, pages=None, window=16):
+        """Yield Documents page by page without keeping chunks, tables or parsed pages around.
+
+        Produces the same Documents, in the same order, as ``extract_tables``
+        followed by ``extract_text``. Both PDF libraries cache parsed objects
+        per open document, so they are reopened every ``window`` pages to keep
+        memory flat however long the PDF is. pdfplumber only parses the pages ``table_pages`` picks.
+        """
+        if pages is None:
+            pages = range(len(self.doc))
+        pages = list(pages)
+        for start in range(0, len(pages), window):
+            batch = pages[start:start + window]
+            with fitz.open(self.pdf_path) as doc:
+                candidates = self.table_pages(batch, doc)
+                with (pdfplumber.open(self.pdf_path, pages=[p + 1 for p in candidates])
+                      if candidates else nullcontext()) as pdf:
+                    table_pages = {page.page_number - 1: page for page in pdf.pages} if pdf is not None else {}
+                    yield from self._iter_window(batch, doc, table_pages)
+
+    def _iter_window(self, batch, doc, table_pages):
+        for page_num in batch:
+            tables = []
+            page = table_pages.get(page_num)
+            if page is not None:
+                with metrics.timer("ingest_extract_tables"):
+                    tables = self._page_tables(page)
+                # Drop pdfplumber's parsed layout of the page
+                page.close()
+            with metrics.timer("ingest_extract_text"):
+                chunks = list(self._page_chunks(page_num, tables, doc))
+            # MuPDF's object store is process-wide and otherwise only grows
+            fitz.TOOLS.store_shrink(100)
+            for chunk in chunks:
+                yield self._to_document(chunk)
 
     def prepare_chunks_for_vectordb(self):
         """
@@ -90,31 +267,36 @@ class PDFProcessor:
         Returns:
             List[Document]: Ready for vector database ingestion.
         """
-        self.documents = []
+        self.documents = [self._to_document(chunk) for chunk in self.chunks]
+        return self.documents
 
-        for chunk in self.chunks:
-            text_content = chunk["text"]
-            metadata = {
-                "page": chunk["metadata"]["page"],
-                "associated_tables": chunk["metadata"].get("associated_tables", [])  # Add tables if present
-            }
+    @staticmethod
+    def _to_document(chunk):
+        metadata = {"page": chunk["metadata"]["page"], "type": chunk["type"]}
+        if chunk["type"] == "table":
+            metadata["table_id"] = chunk["id"]
+        else:
+            metadata["table_ids"] = chunk["metadata"].get("table_ids", [])
 
-            # Create a LangChain Document object
-            document = Document(
-                page_content=text_content,
-                metadata=metadata
-            )
+        # Create a LangChain Document object; tables keep their stable id
+        return Document(
+            id=chunk["id"] if chunk["type"] == "table" else None,
+            page_content=chunk["text"],
+            metadata=metadata
+        )
 
-            self.documents.append(document)
 
-        return self.documents
 
+    def page_hashes(self):
+        """``page_fingerprint`` of each page, keyed by 1-based page number."""
+        with metrics.timer("ingest_page_hashes"):
+            return {page_num + 1: page_fingerprint(page) for page_num, page in enumerate(self.doc)}
 
+    def process_pages(self, pages):
+        """Extract tables and text for one page range and return only its Documents."""
+        return list(self.iter_documents(pages))
 
     def process(self):
         """Run the full processing pipeline: extract tables and text."""
-        self.extract_tables()
-        self.extract_text()
-        self.prepare_chunks_for_vectordb()
-        
+        self.documents = list(self.iter_documents())
         return self.documents
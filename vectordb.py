@@ -1,8 +1,146 @@
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain.schema import Document
+import uuid
+from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple, Union
 from pinecone import Pinecone as PineconeClient, ServerlessSpec
+from local_vectordb import LocalVectorDB
+from manifest import DocumentManifest
+from bulk_ingest import chunk_id
+from lexical_index import LexicalIndex
+from metrics import metrics
+from contextlib import contextmanager
+import threading
+import hashlib
+import asyncio
+import time
+
+MANIFEST_NAMESPACE = "__manifest__"
+
+
+def fetch_documents(index, ids: List[str], text_key: str = "text", batch_size: int = 100) -> List[Document]:
+    """``get_by_ids`` for a Pinecone index, which langchain_pinecone's store does not implement.
+
+    Ids that are not in the index are skipped; the rest come back in the order asked for.
+    """
+    documents = []
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        vectors = index.fetch(ids=batch).vectors
+        for id_ in batch:
+            vector = vectors.get(id_)
+            if vector is None:
+                continue
+            metadata = dict(vector.metadata or {})
+            page_content = metadata.pop(text_key, "")
+            documents.append(Document(id=id_, page_content=page_content, metadata=metadata))
+    return documents
+
+
+async def afetch_documents(index, ids: List[str]) -> List[Document]:
+
+    return await asyncio.to_thread(fetch_documents, index, ids)
+
+
+class PineconeManifest(DocumentManifest):
+    """``DocumentManifest`` kept in a reserved namespace of the Pinecone index, so every replica shares it.
+
+    Each document is a ``doc:`` record plus one ``page:`` record per page,
+    because the vector ids of a whole document can exceed Pinecone's metadata
+    limit. Writes only touch the records of the document they change, and
+    page records are written before the ``doc:`` record that makes them
+    visible. Pinecone has no locks, so ``version`` is a write stamp, not a
+    counter. Reads check it at most every ``refresh_seconds``.
+    """
+
+    def __init__(self, index, dimension: int, namespace: str = MANIFEST_NAMESPACE, refresh_seconds: float = 5.0):
+        self.index = index
+        self.namespace = namespace
+        self.refresh_seconds = refresh_seconds
+        # Pinecone rejects all-zero dense vectors; these are never queried
+        self._placeholder = [1.0] + [0.0] * (dimension - 1)
+        self._lock = threading.Lock()
+        self.version: int = 0
+        self.by_hash: Dict[str, str] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._checked: Optional[float] = None
+        self.reload()
+
+    @staticmethod
+    def _key(filename: str) -> str:
+        return hashlib.sha256(filename.encode()).hexdigest()[:32]
+
+    def _list(self, prefix: Optional[str] = None) -> List[str]:
+        kwargs = {"prefix": prefix} if prefix else {}
+        return [id_ for ids in self.index.list(namespace=self.namespace, **kwargs) for id_ in ids]
+
+    def _fetch(self, ids: List[str], batch_size: int = 100) -> Dict[str, Any]:
+        records = {}
+        for start in range(0, len(ids), batch_size):
+            records.update(self.index.fetch(ids=ids[start:start + batch_size], namespace=self.namespace).vectors)
+        return records
+
+    def reload(self) -> None:
+        records = self._fetch(self._list())
+        documents = {}
+        for id_, record in records.items():
+            if id_.startswith("doc:"):
+                documents[record.metadata["filename"]] = {"sha256": record.metadata["sha256"], "pages": {}}
+        for id_, record in records.items():
+            # Pages of a document whose doc: record is gone (or not written yet) are ignored
+            if id_.startswith("page:") and record.metadata["filename"] in documents:
+                documents[record.metadata["filename"]]["pages"][str(int(record.metadata["page"]))] = {
+                    "sha256": record.metadata["sha256"], "ids": list(record.metadata.get("ids", []))}
+        version = records.get("version")
+        self.version = int(version.metadata["version"]) if version is not None else 0
+        self.by_hash = {document["sha256"]: filename for filename, document in documents.items()}
+        self.documents = documents
+        self._checked = time.monotonic()
+
+    def current_version(self) -> int:
+        """Version in the index, re-read at most every ``refresh_seconds``; other replicas' writes reload it."""
+        if self._checked is not None and time.monotonic() - self._checked < self.refresh_seconds:
+            return self.version
+        self._checked = time.monotonic()
+        record = self._fetch(["version"]).get("version")
+        if (int(record.metadata["version"]) if record is not None else 0) != self.version:
+            self.reload()
+        return self.version
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            self.reload()
+            yield
+
+    def _record(self, id_: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": id_, "values": self._placeholder, "metadata": metadata}
+
+    def _save(self, filename: str, batch_size: int = 100) -> None:
+        key = self._key(filename)
+        document = self.documents.get(filename)
+        pages = []
+        if document is None:
+            self.index.delete(ids=[f"doc:{key}"], namespace=self.namespace)
+        else:
+            for page, entry in document["pages"].items():
+                metadata = {"filename": filename, "page": int(page), "sha256": entry["sha256"]}
+                if entry["ids"]:
+                    metadata["ids"] = entry["ids"]
+                pages.append(self._record(f"page:{key}:{page}", metadata))
+            for start in range(0, len(pages), batch_size):
+                self.index.upsert(vectors=pages[start:start + batch_size], namespace=self.namespace)
+            self.index.upsert(vectors=[self._record(f"doc:{key}", {"filename": filename, "sha256": document["sha256"]})],
+                              namespace=self.namespace)
+        kept = {record["id"] for record in pages}
+        stale = [id_ for id_ in self._list(prefix=f"page:{key}:") if id_ not in kept]
+        for start in range(0, len(stale), 1000):
+            self.index.delete(ids=stale[start:start + 1000], namespace=self.namespace)
+        self.version = time.time_ns()
+        self.index.upsert(vectors=[self._record("version", {"version": str(self.version)})], namespace=self.namespace)
+        self._checked = time.monotonic()
+
 
 class PineconeDB:
     def __init__(
@@ -10,7 +148,8 @@ class PineconeDB:
         pinecone_api_key: str,
         openai_api_key: str,
         index_name: str,
-        embedding_model: str = "text-embedding-3-large"
+        embedding_model: str = "text-embedding-3-large",
+        manifest_dir: str = "vector_index"
     ):
         
         # Initialize Pinecone
@@ -37,6 +176,8 @@ class PineconeDB:
         
         # Get the index
         self.index = self.pc.Index(index_name)
+        self.manifest = PineconeManifest(self.index, dimension)
+        self.lexical = LexicalIndex(Path(manifest_dir) / f"{index_name}.bm25.json")
         
         # Initialize LangChain's Pinecone integration
         self.vectorstore = PineconeVectorStore(
@@ -45,21 +186,43 @@ class PineconeDB:
             text_key="text"
         )
     
-    def is_document_processed(self, pc) -> bool:
+    def is_document_processed(self, file_hash: str) -> bool:
         
-        stats = pc.index.describe_index_stats()
-        return stats.get('total_vector_count') > 0  
+        return self.manifest.has_file(file_hash)
     
     def add_documents(self, documents: List[Document], filename: str) -> List[str]:
     
         texts = [doc.page_content for doc in documents]
         metadatas = [{"text": doc.page_content,  "source": filename,**doc.metadata} for doc in documents]
         
-        return self.vectorstore.add_texts(
-            texts=texts,
-            metadatas=metadatas
-        )
+        with metrics.timer("vector_upsert"):
+            ids = self.vectorstore.add_texts(
+                texts=texts,
+                metadatas=metadatas,
+                ids=[chunk_id(filename, doc) for doc in documents]
+            )
+        self.lexical.update(added=zip(ids, texts, metadatas))
+        return ids
     
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None,
+        batch_size: int = 100
+    ) -> List[str]:
+
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = [
+            {"id": id_, "values": values, "metadata": metadata}
+            for id_, values, metadata in zip(ids, embeddings, metadatas)
+        ]
+        with metrics.timer("vector_upsert"):
+            for start in range(0, len(vectors), batch_size):
+                self.index.upsert(vectors=vectors[start:start + batch_size])
+        return ids
+
     def similarity_search(
         self,
         query: Union[str, Document],
@@ -94,6 +257,54 @@ class PineconeDB:
             filter=filter
         )
     
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+
+        return fetch_documents(self.index, ids)
+
+    async def aget_by_ids(self, ids: List[str]) -> List[Document]:
+
+        return await afetch_documents(self.index, ids)
+
     def delete_documents(self, ids: List[str]) -> None:
     
-        self.vectorstore.delete(ids)
\ No newline at end of file
+        # Sent in batches of 1000 ids, Pinecone's per-request limit
+        self.vectorstore.delete(ids)
+        self.lexical.update(deleted=ids)
+
+    def delete_document(self, filename: str) -> List[str]:
+        """Delete every vector of ``filename`` in one bulk call, then forget it in the manifest."""
+        document = self.manifest.document(filename)
+        if document is None:
+            return []
+        ids = [id_ for entry in document["pages"].values() for id_ in entry["ids"]]
+        with metrics.timer("vector_delete"):
+            self.delete_documents(ids)
+        self.manifest.remove(filename)
+        return ids
+
+
+def create_vectordb(config: Dict[str, Any], index_name: str, **kwargs) -> Union[PineconeDB, LocalVectorDB]:
+    """Build the vector store selected by ``config['vector_backend']`` ('pinecone' or 'local')."""
+    if config.get('vector_backend', 'pinecone') == 'local':
+        return LocalVectorDB(openai_api_key=config.get('openai_key'),
+                             index_name=index_name,
+                             data_dir=config.get('local_index_dir', 'vector_index'),
+                             ann_min_vectors=config.get('local_ann_min_vectors', 0),
+                             **kwargs)
+    return PineconeDB(pinecone_api_key=config.get('pinecone_key'),
+                      openai_api_key=config.get('openai_key'),
+                      index_name=index_name,
+                      manifest_dir=config.get('manifest_dir', 'vector_index'),
+                      **kwargs)
+
+
+def manifest_path(config: Dict[str, Any], index_name: str) -> Path:
+    """Where the local backend keeps the document manifest of ``index_name`` (Pinecone keeps it in the index)."""
+    return Path(config.get('local_index_dir', 'vector_index')) / f"{index_name}.manifest.json"
+
+
+def lexical_index_path(config: Dict[str, Any], index_name: str) -> Path:
+    """The BM25 index of ``index_name``: next to the local index, or under ``manifest_dir`` with Pinecone."""
+    if config.get('vector_backend', 'pinecone') == 'local':
+        return manifest_path(config, index_name).with_name(f"{index_name}.bm25.json")
+    return Path(config.get('manifest_dir', 'vector_index')) / f"{index_name}.bm25.json"